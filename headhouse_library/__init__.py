@@ -1,9 +1,24 @@
 import os
 from flask import Flask
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
 from headhouse_library.routes import pages
+from headhouse_library.admin import admin
+from headhouse_library.api import api
+from headhouse_library.cache import init_cache
+from headhouse_library.passwords import PasswordHasher
+from headhouse_library.metrics import Metrics
+from headhouse_library.assets import Assets, build_assets_command
+from headhouse_library.alerts import Alerts
+from headhouse_library.database import DatabaseProxy, Mongo
+from headhouse_library.commands import (
+    migrate_owners, rebuild_summaries_command, import_expenses_command, clean_budgets, archive_expenses,
+    create_indexes_command
+)
+from headhouse_library.benchmarks import (
+    bench_owner_queries, bench_dashboard, bench_analytics, bench_hashing, bench_db_calls, bench_routes, seed_data,
+    bench_archive
+)
 
 load_dotenv()
 
@@ -14,8 +29,77 @@ def create_app():
     app.config["SECRET_KEY"] = os.environ.get(
         "SECRET_KEY", "pf9Wkove4IKEAXvy-cQkeDPhv9Cb3Ag-wyJILbq_dFw"
     )
-    app.db = MongoClient(app.config["MONGODB_URI"]).get_default_database()
+    app.config["ADMIN_EMAILS"] = [
+        email.strip() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()
+    ]
+    app.config["CACHE_BACKEND"] = os.environ.get("CACHE_BACKEND", "lru")
+    app.config["CACHE_REDIS_URL"] = os.environ.get("CACHE_REDIS_URL")
+    app.config["CACHE_TTL"] = int(os.environ.get("CACHE_TTL", 300))
+    app.config["CACHE_MAX_ENTRIES"] = int(os.environ.get("CACHE_MAX_ENTRIES", 1024))
+    app.config["USER_CONTEXT_TTL"] = int(os.environ.get("USER_CONTEXT_TTL", 30))
+    app.config["IMPORT_BATCH_SIZE"] = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+    app.config["EXPORT_BATCH_SIZE"] = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+    app.config["EXPENSES_PER_PAGE"] = int(os.environ.get("EXPENSES_PER_PAGE", 50))
+    app.config["PASSWORD_SCHEMES"] = os.environ.get("PASSWORD_SCHEMES", "pbkdf2_sha256")
+    app.config["PASSWORD_ROUNDS"] = int(os.environ["PASSWORD_ROUNDS"]) if os.environ.get("PASSWORD_ROUNDS") else None
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 1))
+    app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", (os.cpu_count() or 1) * 2))
+    app.config["PASSWORD_HASH_TIMEOUT"] = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))
+    app.config["METRICS_SERVER_TIMING"] = os.environ.get("METRICS_SERVER_TIMING", "0") == "1"
+    app.config["METRICS_SLOW_QUERY_MS"] = int(os.environ.get("METRICS_SLOW_QUERY_MS", 100))
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+    app.config["MONGO_MAX_POOL_SIZE"] = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+    app.config["MONGO_MIN_POOL_SIZE"] = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+    app.config["MONGO_CONNECT_TIMEOUT_MS"] = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000))
+    app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"] = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    app.config["MONGO_SOCKET_TIMEOUT_MS"] = (
+        int(os.environ["MONGO_SOCKET_TIMEOUT_MS"]) if os.environ.get("MONGO_SOCKET_TIMEOUT_MS") else None
+    )
+    app.config["MONGO_COMPRESSORS"] = os.environ.get("MONGO_COMPRESSORS")
+    app.config["MONGO_READ_PREFERENCE"] = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+    app.config["MONGO_MAX_STALENESS_SECONDS"] = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", -1))
+    app.config["MONGO_READ_YOUR_WRITES_SECONDS"] = int(os.environ.get("MONGO_READ_YOUR_WRITES_SECONDS", 120))
+    app.config["MONGO_CREATE_INDEXES"] = os.environ.get("MONGO_CREATE_INDEXES", "1") == "1"
+    app.config["ASSETS_FINGERPRINT"] = os.environ.get("ASSETS_FINGERPRINT", "0" if app.debug else "1") == "1"
+    if os.environ.get("ASSETS_BUILD_DIR"):
+        app.config["ASSETS_BUILD_DIR"] = os.environ["ASSETS_BUILD_DIR"]
+    app.config["HTML_ETAGS"] = os.environ.get("HTML_ETAGS", "1") == "1"
+    app.config["ALERT_THRESHOLDS"] = [
+        int(threshold) for threshold in os.environ.get("ALERT_THRESHOLDS", "80,100").split(",") if threshold.strip()
+    ]
+    app.config["ALERT_CHANNELS"] = [
+        channel.strip() for channel in os.environ.get("ALERT_CHANNELS", "inbox").split(",") if channel.strip()
+    ]
+    app.config["ALERT_BATCH_SECONDS"] = float(os.environ.get("ALERT_BATCH_SECONDS", 1.0))
+    app.config["ALERT_SMTP_HOST"] = os.environ.get("ALERT_SMTP_HOST", "localhost")
+    app.config["ALERT_SMTP_PORT"] = int(os.environ.get("ALERT_SMTP_PORT", 1025))
+    app.config["ALERT_SMTP_SENDER"] = os.environ.get("ALERT_SMTP_SENDER", "alerts@headhouse.local")
+    metrics = Metrics(app)
+    mongo = Mongo(app, event_listeners=[metrics.command_listener])
+    app.db = DatabaseProxy(mongo)
+    app.read_db = DatabaseProxy(mongo, reads=True)
+    init_cache(app)
+    PasswordHasher(app)
+    Assets(app)
+    Alerts(app)
 
     app.register_blueprint(pages)
+    app.register_blueprint(admin)
+    app.register_blueprint(api)
+    app.cli.add_command(create_indexes_command)
+    app.cli.add_command(migrate_owners)
+    app.cli.add_command(rebuild_summaries_command)
+    app.cli.add_command(import_expenses_command)
+    app.cli.add_command(clean_budgets)
+    app.cli.add_command(archive_expenses)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(bench_owner_queries)
+    app.cli.add_command(bench_dashboard)
+    app.cli.add_command(bench_analytics)
+    app.cli.add_command(bench_hashing)
+    app.cli.add_command(bench_db_calls)
+    app.cli.add_command(seed_data)
+    app.cli.add_command(bench_routes)
+    app.cli.add_command(bench_archive)
 
     return app
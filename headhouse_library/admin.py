@@ -0,0 +1,25 @@
+import functools
+from flask import Blueprint, current_app, jsonify, session, abort
+
+admin = Blueprint("admin", __name__, url_prefix="/admin")
+
+
+def admin_required(route):
+    @functools.wraps(route)
+    def route_wrapper(*args, **kwargs):
+        if session.get("email") not in current_app.config["ADMIN_EMAILS"]:
+            abort(404)
+        return route(*args, **kwargs)
+    return route_wrapper
+
+
+@admin.route("/cache")
+@admin_required
+def cache_stats():
+    return jsonify(current_app.extensions["cache"].stats())
+
+
+@admin.route("/slow-queries")
+@admin_required
+def slow_queries():
+    return jsonify(list(current_app.extensions["metrics"].slow_queries))
@@ -0,0 +1,242 @@
+import atexit
+import datetime
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from email.message import EmailMessage
+from flask import current_app
+from pymongo.errors import BulkWriteError
+
+from headhouse_library.models import Notification
+from headhouse_library.summaries import month_of
+
+logger = logging.getLogger(__name__)
+
+
+def month_name(month):
+    return datetime.date.fromisoformat(month).strftime("%B %Y")
+
+
+def evaluate(summary, caps, thresholds):
+    """Yield (key, message) for every limit the month's running totals have reached."""
+    month = summary["month"]
+    spent = summary.get("spent", 0)
+    budget = summary.get("budget", 0)
+
+    if budget > 0:
+        reached = [threshold for threshold in thresholds if spent >= budget * threshold / 100]
+        if reached:
+            threshold = max(reached)
+            yield (
+                f"budget:{threshold}:{budget:g}",
+                f"You have spent {spent / budget:.0%} of your {month_name(month)} budget "
+                f"($ {spent:.2f} of $ {budget:.2f})."
+            )
+
+    categories = summary.get("categories", {})
+    for category, cap in caps.items():
+        if cap and categories.get(category, 0) >= cap:
+            yield (
+                f"cap:{category}:{cap:g}",
+                f"{category} reached $ {categories[category]:.2f} in {month_name(month)}, "
+                f"over your cap of $ {cap:.2f}."
+            )
+
+
+class InboxChannel:
+    """Stores notifications in the `notification` collection shown on the inbox page."""
+
+    def __init__(self, app):
+        pass
+
+    def deliver(self, db, notifications):
+        db.notification.insert_many([asdict(notification) for notification in notifications], ordered=False)
+
+
+class SmtpChannel:
+    """Mails each user one digest per batch, by default to a local SMTP stand-in on port 1025."""
+
+    def __init__(self, app):
+        self.host = app.config["ALERT_SMTP_HOST"]
+        self.port = app.config["ALERT_SMTP_PORT"]
+        self.sender = app.config["ALERT_SMTP_SENDER"]
+
+    def deliver(self, db, notifications):
+        by_user = {}
+        for notification in notifications:
+            by_user.setdefault(notification.user_id, []).append(notification)
+        emails = {
+            user["_id"]: user["email"]
+            for user in db.user.find({"_id": {"$in": list(by_user)}}, {"email": 1})
+        }
+
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            for user_id, user_notifications in by_user.items():
+                if user_id not in emails:
+                    continue
+                message = EmailMessage()
+                message["From"] = self.sender
+                message["To"] = emails[user_id]
+                message["Subject"] = f"HeadHouse: {len(user_notifications)} budget alert(s)"
+                message.set_content("\n".join(notification.message for notification in user_notifications))
+                smtp.send_message(message)
+
+
+CHANNELS = {"inbox": InboxChannel, "smtp": SmtpChannel}
+
+
+class Alerts:
+    """Checks budgets and category caps after writes, off the request path.
+
+    Writes only record which (user, month) pairs changed. A per-process worker
+    thread picks them up every ALERT_BATCH_SECONDS, reads the running totals
+    from monthly_summary, skips alerts already sent (keys in `alert_log`) and
+    hands the rest to the configured channels in one batch.
+    """
+
+    def __init__(self, app=None):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ALERT_THRESHOLDS", [80, 100])
+        app.config.setdefault("ALERT_CHANNELS", ["inbox"])
+        app.config.setdefault("ALERT_BATCH_SECONDS", 1.0)
+        app.config.setdefault("ALERT_MAX_PENDING", 10000)
+        app.config.setdefault("ALERT_SYNC", False)
+        app.config.setdefault("ALERT_SMTP_HOST", "localhost")
+        app.config.setdefault("ALERT_SMTP_PORT", 1025)
+        app.config.setdefault("ALERT_SMTP_SENDER", "alerts@headhouse.local")
+
+        self.app = app
+        self.thresholds = sorted(app.config["ALERT_THRESHOLDS"])
+        self.channels = [CHANNELS[name](app) for name in app.config["ALERT_CHANNELS"]]
+        self.batch_seconds = app.config["ALERT_BATCH_SECONDS"]
+        self.max_pending = app.config["ALERT_MAX_PENDING"]
+        self.sync = app.config["ALERT_SYNC"]
+        atexit.register(self._flush_logged)
+        app.extensions["alerts"] = self
+
+    def enqueue(self, user_id, months):
+        with self._lock:
+            if user_id not in self._pending and len(self._pending) >= self.max_pending:
+                logger.warning("Alert queue full, skipping checks for user %s.", user_id)
+                return
+            self._pending.setdefault(user_id, set()).update(months)
+
+        if self.sync:
+            self._flush_logged()
+            return
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+        threading.Thread(target=self._work, name="alerts", daemon=True).start()
+
+    def _work(self):
+        while True:
+            self._wakeup.wait()
+            # Let writes arriving close together share one batch.
+            time.sleep(self.batch_seconds)
+            self._wakeup.clear()
+            self._flush_logged()
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Alert batch failed.")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.process(self.app.db, pending)
+
+    def process(self, db, pending):
+        users = {
+            user["_id"]: user
+            for user in db.user.find({"_id": {"$in": list(pending)}}, {"category_caps": 1})
+        }
+        summaries = db.monthly_summary.find({
+            "$or": [
+                {"user_id": user_id, "month": {"$in": sorted(months)}}
+                for user_id, months in pending.items()
+            ]
+        })
+
+        notifications = []
+        for summary in summaries:
+            user = users.get(summary["user_id"])
+            if user is None:
+                continue
+            for key, message in evaluate(summary, user.get("category_caps", {}), self.thresholds):
+                notifications.append(Notification(
+                    _id=uuid.uuid4().hex,
+                    user_id=summary["user_id"],
+                    key=f"{summary['month']}:{key}",
+                    month=summary["month"],
+                    message=message,
+                    created=datetime.datetime.now(datetime.timezone.utc),
+                    read=False
+                ))
+
+        notifications = self.deduplicate(db, notifications)
+        if not notifications:
+            return []
+
+        delivered = False
+        for channel in self.channels:
+            try:
+                channel.deliver(db, notifications)
+                delivered = True
+            except Exception:
+                logger.exception("Delivering %d alerts through %s failed.", len(notifications), type(channel).__name__)
+        if not delivered:
+            # Release the keys so the next write to these months tries again.
+            db.alert_log.delete_many({"_id": {"$in": [self.log_id(notification) for notification in notifications]}})
+            return []
+        return notifications
+
+    @staticmethod
+    def log_id(notification):
+        return f"{notification.user_id}:{notification.key}"
+
+    def deduplicate(self, db, notifications):
+        """Claim alert keys once per user; return the notifications not sent before.
+
+        Claimed keys are released again by process() when no channel delivered them.
+        """
+        if not notifications:
+            return []
+        try:
+            db.alert_log.insert_many([
+                {"_id": self.log_id(notification), "created": notification.created}
+                for notification in notifications
+            ], ordered=False)
+        except BulkWriteError as error:
+            duplicates = {
+                write_error["index"] for write_error in error.details["writeErrors"] if write_error["code"] == 11000
+            }
+            if len(duplicates) < len(error.details["writeErrors"]):
+                raise
+            return [notification for index, notification in enumerate(notifications) if index not in duplicates]
+        return notifications
+
+
+def queue_alerts(user_id, *dates):
+    alerts = current_app.extensions.get("alerts")
+    if alerts is not None and dates:
+        alerts.enqueue(user_id, {month_of(date) for date in dates})
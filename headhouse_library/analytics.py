@@ -0,0 +1,201 @@
+import calendar
+import datetime
+import logging
+import numpy as np
+
+from headhouse_library.forms import EXPENSE_TYPES
+
+logger = logging.getLogger(__name__)
+
+
+def is_month(month):
+    try:
+        return datetime.date.fromisoformat(month).isoformat() == month and month.endswith("-01")
+    except (TypeError, ValueError):
+        return False
+
+
+def month_index(month, first_year):
+    return (int(month[:4]) - first_year) * 12 + int(month[5:7]) - 1
+
+
+def month_label(index, first_year):
+    return f"{first_year + index // 12}-{index % 12 + 1:02d}-01"
+
+
+def load_matrix(db, user_id, today):
+    """Read every monthly summary in one query into a dense (month x category) spend matrix.
+
+    Rows run from January of the first year with data to December of the current year,
+    so the array reshapes cleanly into (years, 12, categories). Summaries whose month is
+    not a YYYY-MM-01 date are logged and left out.
+    """
+    summaries = []
+    for summary in db.monthly_summary.find(
+        {"user_id": user_id}, {"_id": 0, "month": 1, "budget": 1, "categories": 1}
+    ):
+        if is_month(summary.get("month")):
+            summaries.append(summary)
+        else:
+            logger.warning("Skipping monthly summary with invalid month %r for user %s.", summary.get("month"), user_id)
+    if not summaries:
+        return None
+
+    first_year = min(today.year, min(int(summary["month"][:4]) for summary in summaries))
+    last_year = max(today.year, max(int(summary["month"][:4]) for summary in summaries))
+    categories = list(EXPENSE_TYPES)
+    categories += sorted({
+        category for summary in summaries for category in summary.get("categories", {})
+    } - set(categories))
+    column = {category: position for position, category in enumerate(categories)}
+
+    spent = np.zeros(((last_year - first_year + 1) * 12, len(categories)))
+    budget = np.zeros(spent.shape[0])
+    for summary in summaries:
+        row = month_index(summary["month"], first_year)
+        budget[row] = summary.get("budget", 0)
+        for category, amount in summary.get("categories", {}).items():
+            spent[row, column[category]] = amount
+
+    return {"first_year": first_year, "categories": categories, "spent": spent, "budget": budget}
+
+
+def rolling_mean(values, window):
+    """Trailing mean of the last `window` values, NaN until enough values exist."""
+    sums = np.cumsum(np.insert(values, 0, 0.0))
+    means = np.full(values.shape, np.nan)
+    means[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return means
+
+
+def percent_change(current, previous):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+
+
+def forward_fill(budget):
+    """Months without a budget reuse the last budget set before them."""
+    filled_from = np.maximum.accumulate(np.where(budget > 0, np.arange(budget.size), 0))
+    return budget[filled_from]
+
+
+def figures(values):
+    """Round for display and turn NaN into None so results serialize to JSON."""
+    rounded = np.round(np.asarray(values, dtype=float), 2)
+    return np.where(np.isnan(rounded), None, rounded).tolist()
+
+
+def analyze(matrix, today):
+    first_year = matrix["first_year"]
+    categories = matrix["categories"]
+    spent = matrix["spent"]
+    budget = matrix["budget"]
+    totals = spent.sum(axis=1)
+    years = spent.shape[0] // 12
+
+    current = (today.year - first_year) * 12 + today.month - 1
+    previous = current - 1
+
+    # Month over month and year over year for the last complete month, per category.
+    latest = spent[previous] if previous >= 0 else np.zeros(len(categories))
+    month_before = spent[previous - 1] if previous >= 1 else np.zeros(len(categories))
+    year_before = spent[previous - 12] if previous >= 12 else np.zeros(len(categories))
+
+    # Annual totals per category and their year-over-year change.
+    annual = spent.reshape(years, 12, len(categories)).sum(axis=1)
+    annual_totals = annual.sum(axis=1)
+    annual_change = np.concatenate(([np.nan], percent_change(annual_totals[1:], annual_totals[:-1])))
+
+    # Seasonality: average spend of each calendar month over the complete years, relative to the
+    # overall monthly average (1.0 is a typical month). The current year is left out.
+    complete = totals[:max(current - today.month + 1, 0)].reshape(-1, 12)
+    if complete.shape[0]:
+        profile = complete.mean(axis=0)
+        seasonality = profile / profile.mean() if profile.mean() > 0 else np.ones(12)
+        category_profile = spent[:complete.size].reshape(-1, 12, len(categories)).mean(axis=0)
+    else:
+        seasonality = np.ones(12)
+        category_profile = np.zeros((12, len(categories)))
+
+    # Projections: the current month at its daily pace, the rest of the year from the trailing
+    # twelve-month average shaped by the seasonal profile.
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    month_projected = totals[current] / today.day * days_in_month
+    budgets = forward_fill(budget)
+    trailing = totals[max(previous - 11, 0):previous + 1].mean() if previous >= 0 else totals[current]
+    year_start = current - today.month + 1
+    remaining = seasonality[today.month:] * trailing
+    year_spent = totals[year_start:current + 1].sum()
+    year_projected = year_spent - totals[current] + month_projected + remaining.sum()
+    year_budget = budgets[year_start:year_start + 12].sum()
+
+    rolling_3 = rolling_mean(totals, 3)
+    rolling_12 = rolling_mean(totals, 12)
+    shown = slice(0, current + 1)
+
+    return {
+        "categories": categories,
+        "months": [
+            {
+                "month": month_label(index, first_year),
+                "spent": spent_value,
+                "budget": budget_value,
+                "rolling_3": rolling_3_value,
+                "rolling_12": rolling_12_value
+            }
+            for index, spent_value, budget_value, rolling_3_value, rolling_12_value in zip(
+                range(current + 1), figures(totals[shown]), figures(budget[shown]),
+                figures(rolling_3[shown]), figures(rolling_12[shown])
+            )
+        ],
+        "latest_month": month_label(previous, first_year) if previous >= 0 else None,
+        "category_changes": [
+            {
+                "category": category,
+                "spent": amount,
+                "month_over_month": mom,
+                "month_over_month_pct": mom_pct,
+                "year_over_year": yoy,
+                "year_over_year_pct": yoy_pct
+            }
+            for category, amount, mom, mom_pct, yoy, yoy_pct in zip(
+                categories, figures(latest),
+                figures(latest - month_before), figures(percent_change(latest, month_before)),
+                figures(latest - year_before), figures(percent_change(latest, year_before))
+            )
+        ],
+        "years": [
+            {"year": first_year + index, "spent": total, "change_pct": change, "categories": dict(zip(categories, amounts))}
+            for index, (total, change, amounts) in enumerate(zip(
+                figures(annual_totals), figures(annual_change), figures(annual)
+            ))
+        ],
+        "seasonality": {
+            "total": figures(seasonality),
+            "categories": dict(zip(categories, figures(category_profile.T)))
+        },
+        "projection": {
+            "month": {
+                "month": month_label(current, first_year),
+                "spent": figures(totals[current]),
+                "budget": figures(budgets[current]),
+                "projected": figures(month_projected),
+                "overrun": figures(month_projected - budgets[current])
+            },
+            "year": {
+                "year": today.year,
+                "spent": figures(year_spent),
+                "budget": figures(year_budget),
+                "projected": figures(year_projected),
+                "overrun": figures(year_projected - year_budget)
+            }
+        }
+    }
+
+
+def get_analytics(db, user_id, today=None):
+    today = today or datetime.date.today()
+    matrix = load_matrix(db, user_id, today)
+    if matrix is None:
+        return None
+    return analyze(matrix, today)
@@ -0,0 +1,283 @@
+import datetime
+import functools
+import uuid
+from dataclasses import asdict
+from flask import Blueprint, Response, current_app, g, jsonify, request, session
+from werkzeug.exceptions import BadRequest, HTTPException, TooManyRequests
+
+from headhouse_library import archive, ledger, recurring
+from headhouse_library.analytics import get_analytics
+from headhouse_library.dashboard import add_projected, get_dashboard
+from headhouse_library.forms import EXPENSE_TYPES
+from headhouse_library.models import Budget, Expense
+from headhouse_library.pagination import SORT_FIELDS, keyset_page
+from headhouse_library.passwords import HashingBusy, get_hasher
+from headhouse_library.routes import current_user_context
+from headhouse_library.summaries import month_of
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+MAX_BATCH_SIZE = 500
+MAX_PAGE_SIZE = 500
+
+
+@api.errorhandler(HTTPException)
+def json_error(error):
+    response = jsonify(error=error.description)
+    response.status_code = error.code
+    if error.code == 429:
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+def api_login_required(route):
+    @functools.wraps(route)
+    def route_wrapper(*args, **kwargs):
+        user = current_user_context()
+        if user is None:
+            return jsonify(error="Authentication required."), 401
+
+        g.user = user
+        return route(*args, **kwargs)
+    return route_wrapper
+
+
+def json_body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise BadRequest("Expected a JSON object.")
+    return data
+
+
+def conditional(producer, tag=None):
+    """Answer 304 while the user's revision matches If-None-Match, skipping the query entirely."""
+    etag = f"r{ledger.get_revision(current_app.db, g.user._id)}"
+    if tag:
+        etag += f"-{tag}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(producer())
+    response.set_etag(etag)
+    return response
+
+
+def parse_date(value):
+    try:
+        return month_of(datetime.date.fromisoformat(value).isoformat())
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid date {value!r}")
+
+
+def parse_amount(value, minimum):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ValueError(f"amount must be a number of at least {minimum}")
+    return float(value)
+
+
+def parse_expense_fields(data, partial=False):
+    fields = {}
+    if "title" in data or not partial:
+        if not isinstance(data.get("title"), str) or not data["title"].strip():
+            raise ValueError("title is required")
+        fields["title"] = data["title"].strip()
+    if "type" in data or not partial:
+        if data.get("type") not in EXPENSE_TYPES:
+            raise ValueError(f"unknown type {data.get('type')!r}")
+        fields["type"] = data["type"]
+    if "amount" in data or not partial:
+        fields["amount"] = parse_amount(data.get("amount"), 0.01)
+    if "date" in data or not partial:
+        fields["date"] = parse_date(data.get("date"))
+    return fields
+
+
+def serialize_expense(document):
+    return asdict(Expense(**document))
+
+
+@api.route("/session", methods=["POST"])
+def create_session():
+    data = json_body()
+    if not isinstance(data.get("email"), str) or not isinstance(data.get("password"), str):
+        return jsonify(error="Login credentials not correct."), 401
+
+    user_data = current_app.db.user.find_one(
+        {"email": data["email"]}, {"_id": 1, "email": 1, "password": 1}
+    )
+    if not user_data:
+        return jsonify(error="Login credentials not correct."), 401
+
+    try:
+        password_valid, new_hash = get_hasher().verify(data["password"], user_data["password"])
+    except HashingBusy:
+        raise TooManyRequests()
+    if not password_valid:
+        return jsonify(error="Login credentials not correct."), 401
+
+    if new_hash:
+        current_app.db.user.update_one({"_id": user_data["_id"]}, {"$set": {"password": new_hash}})
+    session["user_id"] = user_data["_id"]
+    session["email"] = user_data["email"]
+    return jsonify(user_id=user_data["_id"], email=user_data["email"])
+
+
+@api.route("/session", methods=["DELETE"])
+def delete_session():
+    session.clear()
+    return "", 204
+
+
+@api.route("/expenses")
+@api_login_required
+def list_expenses():
+    try:
+        date = parse_date(request.args.get("month"))
+    except ValueError as error:
+        raise BadRequest(str(error))
+
+    sort = request.args.get("sort", "date")
+    order = request.args.get("order", "asc")
+    category = request.args.get("type")
+    limit = request.args.get("limit", 100, type=int)
+    if sort not in SORT_FIELDS or order not in ("asc", "desc") or (category and category not in EXPENSE_TYPES):
+        raise BadRequest("Unsupported sort, order or type.")
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise BadRequest(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+
+    query = {"user_id": g.user._id, "date": date}
+    if category:
+        query["type"] = category
+    recurring.refresh(current_app.db, g.user, date, date)
+
+    def page():
+        try:
+            options = dict(descending=order == "desc", cursor=request.args.get("after"), limit=limit)
+            expenses, next_cursor = keyset_page(current_app.db.expense, query, sort, **options)
+            if not expenses and date[:4] < str(datetime.date.today().year):
+                expenses, next_cursor = archive.archived_page(
+                    current_app.db, g.user._id, date, category, sort, **options
+                ) or (expenses, next_cursor)
+        except ValueError as error:
+            raise BadRequest(str(error))
+        return {"expenses": [serialize_expense(expense) for expense in expenses], "next": next_cursor}
+
+    return conditional(page)
+
+
+@api.route("/expenses/batch", methods=["POST"])
+@api_login_required
+def batch_expenses():
+    data = json_body()
+    create = data.get("create", [])
+    update = data.get("update", [])
+    delete = data.get("delete", [])
+    if not all(isinstance(items, list) for items in (create, update, delete)):
+        raise BadRequest("create, update and delete must be lists.")
+    if len(create) + len(update) + len(delete) > MAX_BATCH_SIZE:
+        raise BadRequest(f"At most {MAX_BATCH_SIZE} operations per batch.")
+
+    user_id = g.user._id
+    errors = []
+
+    expenses = []
+    for index, item in enumerate(create):
+        try:
+            fields = parse_expense_fields(item if isinstance(item, dict) else {})
+        except ValueError as error:
+            errors.append({"operation": "create", "index": index, "error": str(error)})
+            continue
+        fields["title"] = fields["title"].capitalize()
+        expenses.append(Expense(_id=uuid.uuid4().hex, user_id=user_id, **fields))
+
+    updates = {}
+    for index, item in enumerate(update):
+        try:
+            if not isinstance(item, dict) or not isinstance(item.get("_id"), str):
+                raise ValueError("_id is required")
+            fields = parse_expense_fields(item, partial=True)
+            if not fields:
+                raise ValueError("nothing to update")
+            updates[item["_id"]] = fields
+        except ValueError as error:
+            errors.append({"operation": "update", "index": index, "error": str(error)})
+
+    delete_ids = []
+    for index, expense_id in enumerate(delete):
+        if isinstance(expense_id, str):
+            delete_ids.append(expense_id)
+        else:
+            errors.append({"operation": "delete", "index": index, "error": "expected an expense _id"})
+
+    created = ledger.add_expenses(current_app.db, user_id, expenses)
+    updated = ledger.update_expenses(current_app.db, user_id, updates)
+    deleted = ledger.delete_expenses(current_app.db, user_id, delete_ids)
+
+    missing = (set(updates) - {expense["_id"] for expense in updated}) | \
+        (set(delete_ids) - {expense["_id"] for expense in deleted})
+    errors.extend({"_id": expense_id, "error": "not found"} for expense_id in sorted(missing))
+
+    response = jsonify(
+        created=[serialize_expense(expense) for expense in created],
+        updated=[serialize_expense(expense) for expense in updated],
+        deleted=[expense["_id"] for expense in deleted],
+        errors=errors
+    )
+    response.set_etag(f"r{ledger.get_revision(current_app.db, user_id)}")
+    return response
+
+
+@api.route("/budgets")
+@api_login_required
+def list_budgets():
+    year = request.args.get("year", datetime.date.today().year, type=int)
+
+    def budgets():
+        documents = current_app.db.budget.find(
+            {"user_id": g.user._id, "date": {"$gte": f"{year}-01-01", "$lte": f"{year}-12-31"}}
+        ).sort("date", 1)
+        return {"budgets": [asdict(Budget(**document)) for document in documents]}
+
+    return conditional(budgets)
+
+
+@api.route("/budgets", methods=["PUT"])
+@api_login_required
+def set_budgets():
+    items = json_body().get("budgets")
+    if not isinstance(items, list) or len(items) > MAX_BATCH_SIZE:
+        raise BadRequest(f"budgets must be a list of at most {MAX_BATCH_SIZE} items.")
+
+    amounts = {}
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("expected an object")
+            amounts[parse_date(item.get("date"))] = parse_amount(item.get("amount"), 0)
+        except ValueError as error:
+            raise BadRequest(f"budgets[{index}]: {error}")
+
+    ledger.set_budgets(current_app.db, g.user._id, amounts)
+    response = jsonify(budgets=[{"date": date, "amount": amount} for date, amount in amounts.items()])
+    response.set_etag(f"r{ledger.get_revision(current_app.db, g.user._id)}")
+    return response
+
+
+@api.route("/dashboard/<int:year>")
+@api_login_required
+def dashboard(year):
+    projected = recurring.refresh(current_app.db, g.user, f"{year}-01-01", f"{year}-12-01")
+
+    def summary():
+        data = add_projected(get_dashboard(current_app.db, g.user._id, year), projected)
+        data["months"] = [{**month, "date": month["date"].isoformat()} for month in data["months"]]
+        return data
+
+    return conditional(summary)
+
+
+@api.route("/analytics")
+@api_login_required
+def analytics():
+    today = datetime.date.today()
+    return conditional(lambda: {"analytics": get_analytics(current_app.db, g.user._id, today)}, tag=today.isoformat())
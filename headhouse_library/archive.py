@@ -0,0 +1,145 @@
+import datetime
+import json
+import zlib
+from bson import Binary
+from pymongo.errors import BulkWriteError
+
+from headhouse_library.pagination import decode_cursor, encode_cursor
+from headhouse_library.summaries import month_totals
+
+ARCHIVE_FORMAT = 1
+
+
+def archive_id(user_id, year):
+    return f"{user_id}:{year}"
+
+
+def pack(expenses):
+    """Store expenses column by column (one list per field) as zlib-compressed JSON."""
+    fields = sorted({field for expense in expenses for field in expense} - {"user_id"})
+    columns = {field: [expense.get(field) for expense in expenses] for field in fields}
+    return Binary(zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 9))
+
+
+def unpack(archive):
+    columns = json.loads(zlib.decompress(archive["columns"]))
+    fields = list(columns)
+    return [
+        {"user_id": archive["user_id"], **{field: value for field, value in zip(fields, row) if value is not None}}
+        for row in zip(*columns.values())
+    ]
+
+
+def build_archive(user_id, year, expenses):
+    expenses = sorted(expenses, key=lambda expense: (expense["date"], expense["_id"]))
+    return {
+        "_id": archive_id(user_id, year),
+        "user_id": user_id,
+        "year": year,
+        "format": ARCHIVE_FORMAT,
+        "count": len(expenses),
+        "spent": sum(expense["amount"] for expense in expenses),
+        "months": month_totals(expenses),
+        "columns": pack(expenses)
+    }
+
+
+def year_query(user_id, year):
+    return {"user_id": user_id, "date": {"$gte": f"{year}-01-01", "$lte": f"{year}-12-31"}}
+
+
+def archive_year(db, user_id, year, batch_size=1000):
+    """Move a user's expenses of one year into its archive document; return how many were moved.
+
+    An existing archive of the year is merged in, so a run interrupted between writing
+    the archive and deleting the expenses can simply be repeated.
+    """
+    expenses = list(db.expense.find(year_query(user_id, year)))
+    if not expenses:
+        return 0
+
+    existing = db.expense_archive.find_one({"_id": archive_id(user_id, year)})
+    merged = {expense["_id"]: expense for expense in (unpack(existing) if existing else [])}
+    merged.update((expense["_id"], expense) for expense in expenses)
+
+    db.expense_archive.replace_one(
+        {"_id": archive_id(user_id, year)}, build_archive(user_id, year, merged.values()), upsert=True
+    )
+    ids = [expense["_id"] for expense in expenses]
+    for start in range(0, len(ids), batch_size):
+        db.expense.delete_many({"_id": {"$in": ids[start:start + batch_size]}, "user_id": user_id})
+    return len(expenses)
+
+
+def restore(db, archive):
+    expenses = unpack(archive)
+    if expenses:
+        try:
+            db.expense.insert_many(expenses, ordered=False)
+        except BulkWriteError as error:
+            if any(write_error["code"] != 11000 for write_error in error.details["writeErrors"]):
+                raise
+    db.expense_archive.delete_one({"_id": archive["_id"]})
+
+
+def reopen(db, user_id, dates):
+    """Move archived years touched by a write back into `expense`; return the reopened years.
+
+    Only closed years can be archived, so writes to the current year cost nothing.
+    """
+    years = {int(date[:4]) for date in dates if int(date[:4]) < datetime.date.today().year}
+    if not years:
+        return []
+
+    archives = list(db.expense_archive.find({"_id": {"$in": [archive_id(user_id, year) for year in sorted(years)]}}))
+    for archive in archives:
+        restore(db, archive)
+    return [archive["year"] for archive in archives]
+
+
+def find_archived(db, user_id, date, expense_id):
+    """Read one expense from its year's archive without reopening the year."""
+    archive = db.expense_archive.find_one({"_id": archive_id(user_id, int(date[:4]))})
+    if archive is None:
+        return None
+    return next((expense for expense in unpack(archive) if expense["_id"] == expense_id), None)
+
+
+def archived_page(db, user_id, date, category, sort_field, descending=False, cursor=None, limit=50):
+    """keyset_page() over an archived month, or None when the year is not archived."""
+    archive = db.expense_archive.find_one({"_id": archive_id(user_id, int(date[:4]))})
+    if archive is None:
+        return None
+
+    expenses = [
+        expense for expense in unpack(archive)
+        if expense["date"] == date and (not category or expense["type"] == category)
+    ]
+    expenses.sort(key=lambda expense: (expense[sort_field], expense["_id"]), reverse=descending)
+    if cursor:
+        position = tuple(decode_cursor(cursor))
+        expenses = [
+            expense for expense in expenses
+            if ((expense[sort_field], expense["_id"]) < position if descending
+                else (expense[sort_field], expense["_id"]) > position)
+        ]
+
+    next_cursor = encode_cursor(expenses[limit - 1], sort_field) if len(expenses) > limit else None
+    return expenses[:limit], next_cursor
+
+
+def archived_expenses(db, user_id, start=None, end=None, types=None):
+    """Yield archived expenses in date order, filtered like exporter.export_query()."""
+    query = {"user_id": user_id}
+    if start:
+        query["year"] = {"$gte": int(start[:4])}
+    if end:
+        query.setdefault("year", {})["$lte"] = int(end[:4])
+
+    for archive in db.expense_archive.find(query).sort("year", 1):
+        for expense in unpack(archive):
+            if start and expense["date"] < start or end and expense["date"] > end:
+                continue
+            if types and expense["type"] not in types:
+                continue
+            yield expense
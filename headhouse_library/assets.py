@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+
+
+def _write_atomic(path, data):
+    """Write via a temporary file so workers starting together never serve a half-written asset."""
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, "wb") as target:
+        target.write(data)
+    os.replace(temporary, path)
+
+
+def fingerprinted_name(filename, data):
+    root, extension = os.path.splitext(filename)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+
+
+def build_assets(source_dir, build_dir):
+    """Copy every static file to a content-hashed name with .gz/.br siblings; return the manifest."""
+    manifest = {}
+    for directory, _, files in os.walk(source_dir):
+        for name in files:
+            source = os.path.join(directory, name)
+            filename = os.path.relpath(source, source_dir).replace(os.sep, "/")
+            with open(source, "rb") as source_file:
+                data = source_file.read()
+
+            built = fingerprinted_name(filename, data)
+            manifest[filename] = built
+            target = os.path.join(build_dir, built)
+            if os.path.exists(target):
+                continue
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write_atomic(target, data)
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                _write_atomic(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write_atomic(target + ".br", brotli.compress(data))
+
+    _write_atomic(os.path.join(build_dir, "manifest.json"), json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+class Assets:
+    """Serves fingerprinted, precompressed static files and adds ETags to HTML pages."""
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ASSETS_FINGERPRINT", not app.debug)
+        app.config.setdefault("ASSETS_BUILD_DIR", os.path.join(app.instance_path, "assets"))
+        app.config.setdefault("ASSETS_MAX_AGE", 365 * 24 * 3600)
+        app.config.setdefault("HTML_ETAGS", True)
+        self.build_dir = app.config["ASSETS_BUILD_DIR"]
+        self.max_age = app.config["ASSETS_MAX_AGE"]
+
+        if app.config["ASSETS_FINGERPRINT"]:
+            os.makedirs(self.build_dir, exist_ok=True)
+            self.manifest = build_assets(app.static_folder, self.build_dir)
+            self.built = set(self.manifest.values())
+            self.send_static_file = app.view_functions["static"]
+            app.view_functions["static"] = self.static_view
+            app.url_defaults(self.fingerprint_url)
+        if app.config["HTML_ETAGS"]:
+            app.after_request(conditional_html)
+        app.extensions["assets"] = self
+
+    def fingerprint_url(self, endpoint, values):
+        if endpoint == "static" and values.get("filename") in self.manifest:
+            values["filename"] = self.manifest[values["filename"]]
+
+    def static_view(self, filename):
+        if filename not in self.built:
+            return self.send_static_file(filename=filename)
+
+        encoding = None
+        for candidate, extension in (("br", ".br"), ("gzip", ".gz")):
+            if request.accept_encodings[candidate] and os.path.exists(os.path.join(self.build_dir, filename + extension)):
+                encoding = candidate
+                filename += extension
+                break
+
+        response = send_from_directory(
+            self.build_dir,
+            filename,
+            mimetype=mimetypes.guess_type(filename.removesuffix(".br").removesuffix(".gz"))[0],
+            max_age=self.max_age
+        )
+        response.headers.pop("Content-Disposition", None)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def conditional_html(response):
+    """Let browsers revalidate rendered pages with If-None-Match instead of downloading them again."""
+    if (
+        request.method == "GET"
+        and response.status_code == 200
+        and response.mimetype == "text/html"
+        and not response.is_streamed
+    ):
+        response.add_etag()
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+        response.make_conditional(request)
+    return response
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress the static files into ASSETS_BUILD_DIR ahead of deployment."""
+    build_dir = current_app.config["ASSETS_BUILD_DIR"]
+    os.makedirs(build_dir, exist_ok=True)
+    manifest = build_assets(current_app.static_folder, build_dir)
+    for filename, built in sorted(manifest.items()):
+        click.echo(f"{filename} -> {built}")
+    click.echo(f"brotli: {'yes' if brotli is not None else 'no, run `pip install brotli`'}")
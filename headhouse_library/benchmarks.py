@@ -0,0 +1,681 @@
+import contextlib
+import datetime
+import http.client
+import json
+import random
+import subprocess
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import bson
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from pymongo.errors import OperationFailure
+from werkzeug.serving import make_server
+
+from headhouse_library.analytics import get_analytics
+from headhouse_library.archive import archive_year
+from headhouse_library.cache import NullCache
+from headhouse_library.database import create_indexes
+from headhouse_library.forms import EXPENSE_TYPES
+from headhouse_library.summaries import rebuild_summaries
+from headhouse_library.passwords import HashingBusy, get_hasher, verify_password
+
+
+class CountingCollection:
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter.calls += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    """Database proxy counting collection operations (round trips, not getMores)."""
+
+    def __init__(self, db):
+        self._db = db
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if hasattr(attr, "find_one"):
+            return CountingCollection(attr, self)
+        return attr
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self)
+
+
+def scratch_database(use_mongomock):
+    if use_mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            raise click.ClickException("mongomock is not installed, run `pip install mongomock`.")
+        return mongomock.MongoClient().get_database("headhouse_bench")
+
+    db = current_app.db
+    return db.client.get_database(f"{db.name}_bench")
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[round(pct / 100 * (len(ordered) - 1))]
+
+
+def month_dates(years, last_year=2023):
+    return [
+        f"{year}-{month:02d}-01"
+        for year in range(last_year - years + 1, last_year + 1)
+        for month in range(1, 13)
+    ]
+
+
+def seed_owner_expenses(db, user_id, count, years=10, batch_size=10000):
+    dates = month_dates(years)
+    ids = []
+    batch = []
+    for _ in range(count):
+        expense_id = uuid.uuid4().hex
+        ids.append(expense_id)
+        batch.append({
+            "_id": expense_id,
+            "user_id": user_id,
+            "title": "Benchmark",
+            "type": random.choice(EXPENSE_TYPES),
+            "amount": round(random.uniform(1, 500), 2),
+            "date": random.choice(dates)
+        })
+        if len(batch) == batch_size:
+            db.expense.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db.expense.insert_many(batch, ordered=False)
+    return ids
+
+
+def seed_owner_budgets(db, user_id, years=10):
+    db.budget.insert_many([
+        {
+            "_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "amount": round(random.uniform(1000, 5000), 2),
+            "date": date
+        }
+        for date in month_dates(years)
+    ])
+
+
+def seed_bench_user(db, expenses, years=10, email=None, password_hash=""):
+    user_id = uuid.uuid4().hex
+    db.user.insert_one({"_id": user_id, "email": email or f"{user_id}@example.com", "password": password_hash})
+    seed_owner_expenses(db, user_id, expenses, years=years)
+    seed_owner_budgets(db, user_id, years=years)
+    rebuild_summaries(db, user_id)
+    return user_id
+
+
+BENCH_PASSWORD = "benchmark-password"
+
+
+def seed_users(db, users, years, expenses_per_month, password_hash=""):
+    """Seed `users` accounts with `years` of budgets and expenses; return their (user_id, email) pairs."""
+    seeded = []
+    for index in range(users):
+        email = f"bench-{index}@example.com"
+        user_id = seed_bench_user(
+            db, expenses_per_month * 12 * years, years=years, email=email, password_hash=password_hash
+        )
+        seeded.append((user_id, email))
+    return seeded
+
+
+@contextlib.contextmanager
+def bench_app(app, db, use_cache=True):
+    original_db, original_read_db = app.db, app.read_db
+    original_csrf = app.config.get("WTF_CSRF_ENABLED", True)
+    original_create_indexes = app.config["MONGO_CREATE_INDEXES"]
+    original_cache = app.extensions["cache"]
+    original_alerts = app.extensions.pop("alerts", None)
+    app.db = app.read_db = db
+    app.config["WTF_CSRF_ENABLED"] = False
+    # Benchmarks create the scratch database's indexes themselves, and alert checks run off the
+    # request path against whatever app.db is when the batch fires; keep both out of the numbers.
+    app.config["MONGO_CREATE_INDEXES"] = False
+    if not use_cache:
+        app.extensions["cache"] = NullCache()
+    try:
+        yield app
+    finally:
+        app.db, app.read_db = original_db, original_read_db
+        app.config["WTF_CSRF_ENABLED"] = original_csrf
+        app.config["MONGO_CREATE_INDEXES"] = original_create_indexes
+        app.extensions["cache"] = original_cache
+        if original_alerts is not None:
+            app.extensions["alerts"] = original_alerts
+
+
+@contextlib.contextmanager
+def logged_in_client(app, db, user_id, use_cache=True):
+    with bench_app(app, db, use_cache):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+            session["email"] = f"{user_id}@example.com"
+        yield client
+
+
+class TestClientDriver:
+    """Sends benchmark requests through Flask's test client, one client per user."""
+
+    def __init__(self, app, users):
+        self.app = app
+        self.clients = {}
+        for user_id, email in users:
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session["user_id"] = user_id
+                session["email"] = email
+            self.clients[user_id] = client
+
+    def request(self, user_id, method, path, data=None):
+        client = self.clients[user_id] if user_id else self.app.test_client()
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        return response.status_code
+
+
+class HttpDriver:
+    """Sends benchmark requests over HTTP to a threaded server, logging every user in first."""
+
+    def __init__(self, host, port, users):
+        self.host = host
+        self.port = port
+        self.cookies = {}
+        for user_id, email in users:
+            status, cookie = self._send("POST", "/login", {"email": email, "password": BENCH_PASSWORD})
+            if status != 302 or not cookie:
+                raise click.ClickException(f"could not log {email} in over HTTP ({status}).")
+            self.cookies[user_id] = cookie.split(";", 1)[0]
+
+    def _send(self, method, path, data=None, cookie=None):
+        headers = {"Cookie": cookie} if cookie else {}
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, response.getheader("Set-Cookie")
+        finally:
+            connection.close()
+
+    def request(self, user_id, method, path, data=None):
+        return self._send(method, path, data, self.cookies.get(user_id))[0]
+
+
+@contextlib.contextmanager
+def http_server(app):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.host, server.port
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def route_requests(users, dates):
+    """The routes driven by `bench-routes`, as name -> function building a random request."""
+    def pick():
+        return random.choice(users), random.choice(dates)
+
+    def index():
+        (user_id, _), date = pick()
+        return user_id, "GET", f"/?date={date}", None
+
+    def budget_manager():
+        (user_id, _), date = pick()
+        return user_id, "GET", f"/budget_manager?date={date}", None
+
+    def add_expense():
+        (user_id, _), date = pick()
+        data = {"title": "Benchmark", "type": random.choice(EXPENSE_TYPES), "amount": "12.5"}
+        return user_id, "POST", f"/budget_manager/add_expense/{date}", data
+
+    def set_budget():
+        (user_id, _), date = pick()
+        return user_id, "POST", f"/budget_manager/set_budget/{date}", {"amount": str(random.randint(1000, 5000))}
+
+    def login():
+        (_, email), _ = pick()
+        return None, "POST", "/login", {"email": email, "password": BENCH_PASSWORD}
+
+    return {
+        "index": (index, 200),
+        "budget_manager": (budget_manager, 200),
+        "add_expense": (add_expense, 302),
+        "set_budget": (set_budget, 302),
+        "login": (login, 302)
+    }
+
+
+def drive(driver, make_request, expected_status, count, concurrency):
+    def send(_):
+        user_id, method, path, data = make_request()
+        start = time.perf_counter()
+        status = driver.request(user_id, method, path, data)
+        return (time.perf_counter() - start) * 1000, status == expected_status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as threads:
+        results = list(threads.map(send, range(count)))
+    elapsed = time.perf_counter() - start
+
+    samples = [sample for sample, _ in results]
+    return {
+        "requests": count,
+        "errors": sum(1 for _, success in results if not success),
+        "throughput_rps": round(count / elapsed, 2),
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command("bench-owner-queries")
+@click.option("--sizes", default="1000,10000,50000", show_default=True, help="Expenses per user, comma separated.")
+@click.option("--repeat", default=20, show_default=True)
+@click.option("--mongomock", "use_mongomock", is_flag=True, help="Run against mongomock instead of MONGODB_URI.")
+@with_appcontext
+def bench_owner_queries(sizes, repeat, use_mongomock):
+    """Compare the legacy `$in` ID-array reads with owner-indexed reads."""
+    db = scratch_database(use_mongomock)
+    year_match = {"$gte": "2023-01-01", "$lte": "2023-12-31"}
+    group = {"$group": {"_id": None, "total_expenses": {"$sum": "$amount"}}}
+
+    click.echo(f"{'expenses':>10} {'legacy p50':>12} {'legacy p95':>12} {'owner p50':>12} {'owner p95':>12}")
+    for size in (int(size) for size in sizes.split(",")):
+        db.client.drop_database(db.name)
+        create_indexes(db)
+        user_id = uuid.uuid4().hex
+        expense_ids = seed_owner_expenses(db, user_id, size)
+        db.user.insert_one({"_id": user_id, "email": "bench@example.com", "expenses": expense_ids})
+
+        def legacy():
+            user = db.user.find_one({"_id": user_id})
+            list(db.expense.aggregate([
+                {"$match": {"date": year_match, "_id": {"$in": user["expenses"]}}}, group
+            ]))
+
+        def owner():
+            list(db.expense.aggregate([
+                {"$match": {"date": year_match, "user_id": user_id}}, group
+            ]))
+
+        legacy_samples = timed(legacy, repeat)
+        owner_samples = timed(owner, repeat)
+        click.echo(
+            f"{size:>10} {percentile(legacy_samples, 50):>10.2f}ms {percentile(legacy_samples, 95):>10.2f}ms "
+            f"{percentile(owner_samples, 50):>10.2f}ms {percentile(owner_samples, 95):>10.2f}ms"
+        )
+
+    db.client.drop_database(db.name)
+
+
+@click.command("bench-dashboard")
+@click.option("--expenses", default=20000, show_default=True, help="Expenses seeded for the user.")
+@click.option("--years", default=10, show_default=True)
+@click.option("--repeat", default=50, show_default=True)
+@click.option("--max-round-trips", default=2, show_default=True,
+              help="Fail when an uncached `index` needs more DB calls (user lookup included).")
+@click.option("--mongomock", "use_mongomock", is_flag=True, help="Run against mongomock instead of MONGODB_URI.")
+@with_appcontext
+def bench_dashboard(expenses, years, repeat, max_round_trips, use_mongomock):
+    """Measure DB round trips and p50/p95 latency of the uncached `index` dashboard."""
+    db = scratch_database(use_mongomock)
+    db.client.drop_database(db.name)
+    create_indexes(db)
+    user_id = seed_bench_user(db, expenses, years=years)
+
+    counting_db = CountingDatabase(db)
+    try:
+        with logged_in_client(current_app._get_current_object(), counting_db, user_id, use_cache=False) as client:
+            response = client.get("/?date=2023-06-01")
+            if response.status_code != 200:
+                raise click.ClickException(f"index returned {response.status_code}")
+            round_trips = counting_db.calls
+
+            samples = timed(lambda: client.get("/?date=2023-06-01"), repeat)
+    finally:
+        db.client.drop_database(db.name)
+
+    click.echo(f"expenses={expenses} round_trips={round_trips} "
+               f"p50={percentile(samples, 50):.2f}ms p95={percentile(samples, 95):.2f}ms")
+    if round_trips > max_round_trips:
+        raise click.ClickException(f"index used {round_trips} round trips, expected at most {max_round_trips}.")
+
+
+@click.command("bench-analytics")
+@click.option("--expenses", default=20000, show_default=True, help="Expenses seeded for the user.")
+@click.option("--years", default=20, show_default=True)
+@click.option("--repeat", default=50, show_default=True)
+@click.option("--max-ms", default=100.0, show_default=True, help="Fail when the uncached page's p95 is slower.")
+@click.option("--mongomock", "use_mongomock", is_flag=True, help="Run against mongomock instead of MONGODB_URI.")
+@with_appcontext
+def bench_analytics(expenses, years, repeat, max_ms, use_mongomock):
+    """Measure the analytics computation and the uncached `analytics` page over many years."""
+    db = scratch_database(use_mongomock)
+    db.client.drop_database(db.name)
+    create_indexes(db)
+    user_id = seed_bench_user(db, expenses, years=years)
+
+    try:
+        compute_samples = timed(lambda: get_analytics(db, user_id), repeat)
+        with logged_in_client(current_app._get_current_object(), db, user_id, use_cache=False) as client:
+            response = client.get("/analytics")
+            if response.status_code != 200:
+                raise click.ClickException(f"analytics returned {response.status_code}")
+            page_samples = timed(lambda: client.get("/analytics"), repeat)
+    finally:
+        db.client.drop_database(db.name)
+
+    click.echo(f"years={years} expenses={expenses} "
+               f"compute p50={percentile(compute_samples, 50):.2f}ms p95={percentile(compute_samples, 95):.2f}ms "
+               f"page p50={percentile(page_samples, 50):.2f}ms p95={percentile(page_samples, 95):.2f}ms")
+    if percentile(page_samples, 95) > max_ms:
+        raise click.ClickException(f"analytics p95 {percentile(page_samples, 95):.2f}ms exceeds {max_ms}ms.")
+
+
+@click.command("bench-hashing")
+@click.option("--logins", default=200, show_default=True, help="Password verifications to run.")
+@click.option("--concurrency", default=None, type=int, help="Concurrent callers, defaults to twice the pool size.")
+@with_appcontext
+def bench_hashing(logins, concurrency):
+    """Measure password verifications per second with the configured policy."""
+    hasher = get_hasher()
+    password_hash = hasher.hash("benchmark-password")
+
+    inline_samples = timed(lambda: verify_password(hasher.policy, "benchmark-password", password_hash), 10)
+    click.echo(f"policy={','.join(hasher.policy[0])} rounds={hasher.policy[1] or 'default'} "
+               f"inline p50={percentile(inline_samples, 50):.1f}ms ({1000 / percentile(inline_samples, 50):.1f} logins/s/core)")
+
+    def attempt(_):
+        try:
+            hasher.verify("benchmark-password", password_hash)
+            return True
+        except HashingBusy:
+            return False
+
+    concurrency = concurrency or max(hasher.workers, 1) * 2
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as threads:
+        accepted = sum(threads.map(attempt, range(logins)))
+    elapsed = time.perf_counter() - start
+
+    click.echo(f"pool workers={hasher.workers} concurrency={concurrency} accepted={accepted} "
+               f"rejected={logins - accepted} {accepted / elapsed:.1f} logins/s "
+               f"({accepted / elapsed / max(hasher.workers, 1):.1f} logins/s/core)")
+
+
+# Most database calls each page may make; bench-db-calls fails when a change goes over them.
+MAX_DB_CALLS = {
+    "index": 2,
+    "index (cached)": 0,
+    "budget_manager": 3,
+    "set_budget": 4,
+    "add_expense": 4,
+    "edit_expense": 5,
+    "delete_expense": 5,
+    "export": 2
+}
+
+
+@click.command("bench-db-calls")
+@click.option("--expenses", default=2000, show_default=True, help="Expenses seeded for the user.")
+@click.option("--max-calls", "limits", multiple=True, metavar="PAGE=N",
+              help="Override a page's maximum, e.g. --max-calls index=3.")
+@click.option("--mongomock", "use_mongomock", is_flag=True, help="Run against mongomock instead of MONGODB_URI.")
+@with_appcontext
+def bench_db_calls(expenses, limits, use_mongomock):
+    """Count the database calls each page makes for a logged-in user; fail above MAX_DB_CALLS."""
+    maximums = dict(MAX_DB_CALLS)
+    for limit in limits:
+        page, _, value = limit.partition("=")
+        if page not in maximums or not value.isdigit():
+            raise click.BadParameter(f"{limit!r} is not PAGE=N for one of {', '.join(maximums)}.", param_hint="--max-calls")
+        maximums[page] = int(value)
+
+    db = scratch_database(use_mongomock)
+    db.client.drop_database(db.name)
+    create_indexes(db)
+    user_id = seed_bench_user(db, expenses)
+    existing = db.expense.find_one({"user_id": user_id}, {"_id": 1, "date": 1})
+    expense = {"title": "Benchmark", "type": "Food", "amount": "12.5"}
+    edit_url = f"/budget_manager/edit_expense/{existing['date']}/{existing['_id']}"
+    delete_url = f"/budget_manager/delete_expense/{existing['date']}/{existing['_id']}"
+
+    requests = [
+        ("index", "GET", "/?date=2023-06-01", None, 200),
+        ("index (cached)", "GET", "/?date=2023-06-01", None, 200),
+        ("budget_manager", "GET", "/budget_manager?date=2023-06-01", None, 200),
+        ("set_budget", "POST", "/budget_manager/set_budget/2023-06-01", {"amount": "1500"}, 302),
+        ("add_expense", "POST", "/budget_manager/add_expense/2023-06-01", expense, 302),
+        ("edit_expense", "POST", edit_url, expense, 302),
+        ("delete_expense", "POST", delete_url, {}, 302),
+        ("export", "GET", "/export?start=2023-01-01&end=2023-12-31", None, 200)
+    ]
+
+    failures = []
+    counting_db = CountingDatabase(db)
+    try:
+        with logged_in_client(current_app._get_current_object(), counting_db, user_id) as client:
+            for name, method, url, data, expected_status in requests:
+                counting_db.calls = 0
+                response = client.open(url, method=method, data=data)
+                response.get_data()
+                click.echo(f"{name:<16} {response.status_code} {counting_db.calls:>3} db calls (max {maximums[name]})")
+                if response.status_code != expected_status:
+                    failures.append(f"{name} returned {response.status_code}")
+                elif counting_db.calls > maximums[name]:
+                    failures.append(f"{name} used {counting_db.calls} db calls, expected at most {maximums[name]}")
+    finally:
+        db.client.drop_database(db.name)
+
+    if failures:
+        raise click.ClickException("; ".join(failures) + ".")
+
+
+@click.command("seed-data")
+@click.option("--users", default=10, show_default=True)
+@click.option("--years", default=5, show_default=True)
+@click.option("--expenses-per-month", default=30, show_default=True)
+@click.option("--drop", is_flag=True, help="Drop the benchmark database first.")
+@with_appcontext
+def seed_data(users, years, expenses_per_month, drop):
+    """Seed the `<database>_bench` database with users, budgets and expenses."""
+    db = scratch_database(False)
+    if drop:
+        db.client.drop_database(db.name)
+    create_indexes(db)
+
+    start = time.perf_counter()
+    seeded = seed_users(db, users, years, expenses_per_month, password_hash=get_hasher().hash(BENCH_PASSWORD))
+    click.echo(f"seeded {len(seeded)} users x {years} years x {expenses_per_month} expenses/month "
+               f"into {db.name} in {time.perf_counter() - start:.1f}s")
+    click.echo(f"log in as {seeded[0][1]} .. {seeded[-1][1]} with password {BENCH_PASSWORD!r}")
+
+
+@click.command("bench-routes")
+@click.option("--users", default=10, show_default=True)
+@click.option("--years", default="1,5,10", show_default=True, help="History per user, comma separated.")
+@click.option("--expenses-per-month", default=30, show_default=True)
+@click.option("--requests", "count", default=200, show_default=True, help="Requests per route and data size.")
+@click.option("--concurrency", default=8, show_default=True)
+@click.option("--driver", type=click.Choice(["test-client", "http"]), default="test-client", show_default=True)
+@click.option("--routes", default="index,budget_manager,add_expense,set_budget,login", show_default=True)
+@click.option("--output", type=click.Path(dir_okay=False, writable=True), help="Write the JSON results here.")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Earlier JSON results to compare with.")
+@click.option("--mongomock", "use_mongomock", is_flag=True, help="Run against mongomock instead of MONGODB_URI.")
+@with_appcontext
+def bench_routes(users, years, expenses_per_month, count, concurrency, driver, routes, output, baseline, use_mongomock):
+    """Measure throughput and p50/p95/p99 latency of the main routes as the data grows."""
+    app = current_app._get_current_object()
+    db = scratch_database(use_mongomock)
+    password_hash = get_hasher().hash(BENCH_PASSWORD)
+    routes = routes.split(",")
+
+    results = []
+    try:
+        for year_count in (int(year_count) for year_count in years.split(",")):
+            db.client.drop_database(db.name)
+            create_indexes(db)
+            seeded = seed_users(db, users, year_count, expenses_per_month, password_hash=password_hash)
+            plan = route_requests(seeded, month_dates(year_count))
+
+            with bench_app(app, db), contextlib.ExitStack() as stack:
+                if driver == "http":
+                    runner = HttpDriver(*stack.enter_context(http_server(app)), seeded)
+                else:
+                    runner = TestClientDriver(app, seeded)
+
+                for route in routes:
+                    make_request, expected_status = plan[route]
+                    result = {
+                        "route": route,
+                        "years": year_count,
+                        "expenses_per_user": expenses_per_month * 12 * year_count,
+                        **drive(runner, make_request, expected_status, count, concurrency)
+                    }
+                    results.append(result)
+                    click.echo(
+                        f"{route:<15} years={year_count:<3} {result['throughput_rps']:>8.1f} req/s "
+                        f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms p99={result['p99_ms']:.2f}ms "
+                        f"errors={result['errors']}",
+                        err=True
+                    )
+    finally:
+        db.client.drop_database(db.name)
+
+    report = {
+        "revision": git_revision(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "settings": {
+            "driver": driver,
+            "users": users,
+            "expenses_per_month": expenses_per_month,
+            "requests": count,
+            "concurrency": concurrency,
+            "mongomock": use_mongomock
+        },
+        "results": results
+    }
+
+    if baseline:
+        with open(baseline) as baseline_file:
+            previous = {(r["route"], r["years"]): r for r in json.load(baseline_file)["results"]}
+        for result in results:
+            before = previous.get((result["route"], result["years"]))
+            if before and before["p95_ms"]:
+                result["p95_change_pct"] = round((result["p95_ms"] / before["p95_ms"] - 1) * 100, 1)
+
+    if output:
+        with open(output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        click.echo(json.dumps(report, indent=2))
+
+
+def collection_size(db, name):
+    """(data bytes, index bytes) from collStats, or a BSON size estimate without index sizes."""
+    try:
+        stats = db.command({"collStats": name})
+        return stats["size"], stats["totalIndexSize"]
+    except (OperationFailure, NotImplementedError):
+        return sum(len(bson.encode(document)) for document in db[name].find()), None
+
+
+def format_size(size):
+    return "n/a" if size is None else f"{size / 1024:.0f}KiB"
+
+
+@click.command("bench-archive")
+@click.option("--expenses", default=50000, show_default=True, help="Expenses seeded for the user.")
+@click.option("--years", default=10, show_default=True)
+@click.option("--repeat", default=50, show_default=True)
+@click.option("--mongomock", "use_mongomock", is_flag=True, help="Run against mongomock instead of MONGODB_URI.")
+@with_appcontext
+def bench_archive(expenses, years, repeat, use_mongomock):
+    """Compare storage and `budget_manager` latency before and after archiving closed years."""
+    db = scratch_database(use_mongomock)
+    db.client.drop_database(db.name)
+    create_indexes(db)
+    user_id = seed_bench_user(db, expenses, years=years)
+    last_year = int(month_dates(years)[-1][:4])
+    archived_month, hot_month = f"{last_year - 1}-06-01", f"{last_year}-06-01"
+
+    def page_samples(client, date):
+        response = client.get(f"/budget_manager?date={date}")
+        if response.status_code != 200 or b"Benchmark" not in response.data:
+            raise click.ClickException(f"budget_manager for {date} returned {response.status_code}")
+        return timed(lambda: client.get(f"/budget_manager?date={date}"), repeat)
+
+    try:
+        with logged_in_client(current_app._get_current_object(), db, user_id, use_cache=False) as client:
+            before = {"expense": collection_size(db, "expense")}
+            before_samples = page_samples(client, archived_month)
+
+            for year in range(last_year - years + 1, last_year):
+                archive_year(db, user_id, year)
+
+            after = {name: collection_size(db, name) for name in ("expense", "expense_archive")}
+            archived_samples = page_samples(client, archived_month)
+            hot_samples = page_samples(client, hot_month)
+    finally:
+        db.client.drop_database(db.name)
+
+    click.echo(f"years={years} expenses={expenses} archived years={years - 1}")
+    click.echo(f"before: expense data={format_size(before['expense'][0])} indexes={format_size(before['expense'][1])}")
+    for name, (size, index_size) in after.items():
+        click.echo(f"after:  {name} data={format_size(size)} indexes={format_size(index_size)}")
+    for label, samples in (
+        (f"{archived_month} before archiving", before_samples),
+        (f"{archived_month} archived", archived_samples),
+        (f"{hot_month} hot", hot_samples)
+    ):
+        click.echo(f"budget_manager {label}: p50={percentile(samples, 50):.2f}ms p95={percentile(samples, 95):.2f}ms")
@@ -0,0 +1,172 @@
+import datetime
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+from headhouse_library.summaries import month_of
+
+MISSING = object()
+
+
+class LRUCache:
+    """In-process cache, only consistent when a single worker serves a user.
+
+    Every key carries a version that invalidation bumps, so a value computed
+    before a write can never be stored after it.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            version = self._versions.get(key, 0)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self._stats["evictions"] += 1
+                self._stats["misses"] += 1
+                return MISSING, version
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1], version
+
+    def set(self, key, value, version, ttl=None):
+        with self._lock:
+            if self._versions.get(key, 0) != version:
+                return
+
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+                self._versions.move_to_end(key)
+            while len(self._versions) > self.max_entries * 4:
+                self._versions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+class RedisCache:
+    """Cache shared by every worker; size is bounded by Redis' own maxmemory policy."""
+
+    def __init__(self, url, ttl=300, prefix="headhouse:cache:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package, run `pip install redis`.")
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value, version = self._redis.mget(self.prefix + key, self.prefix + "version:" + key)
+        version = int(version or 0)
+        if value is not None:
+            stored_version, value = pickle.loads(value)
+            if stored_version != version:
+                value = None
+
+        self._redis.hincrby(self.prefix + "stats", "hits" if value is not None else "misses")
+        return (MISSING if value is None else value), version
+
+    def set(self, key, value, version, ttl=None):
+        self._redis.set(self.prefix + key, pickle.dumps((version, value)), ex=ttl or self.ttl)
+
+    def invalidate(self, *keys):
+        if not keys:
+            return
+
+        pipeline = self._redis.pipeline()
+        for key in keys:
+            pipeline.incr(self.prefix + "version:" + key)
+            pipeline.expire(self.prefix + "version:" + key, self.ttl * 2)
+            pipeline.delete(self.prefix + key)
+        pipeline.execute()
+
+    def stats(self):
+        counters = self._redis.hgetall(self.prefix + "stats")
+        return {
+            "hits": int(counters.get(b"hits", 0)),
+            "misses": int(counters.get(b"misses", 0)),
+            "evictions": self._redis.info("stats").get("evicted_keys", 0)
+        }
+
+
+class NullCache:
+    def get(self, key):
+        return MISSING, 0
+
+    def set(self, key, value, version, ttl=None):
+        pass
+
+    def invalidate(self, *keys):
+        pass
+
+    def stats(self):
+        return {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def init_cache(app):
+    backend = app.config.setdefault("CACHE_BACKEND", "lru")
+    ttl = app.config.setdefault("CACHE_TTL", 300)
+
+    if backend == "lru":
+        cache = LRUCache(max_entries=app.config.setdefault("CACHE_MAX_ENTRIES", 1024), ttl=ttl)
+    elif backend == "redis":
+        cache = RedisCache(app.config["CACHE_REDIS_URL"], ttl=ttl)
+    elif backend == "null":
+        cache = NullCache()
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND {backend!r}.")
+
+    app.extensions["cache"] = cache
+    return cache
+
+
+def cache_key(user_id, period, view):
+    return f"{user_id}:{period}:{view}"
+
+
+def cached(user_id, period, view, producer, ttl=None):
+    cache = current_app.extensions["cache"]
+    key = cache_key(user_id, period, view)
+
+    value, version = cache.get(key)
+    if value is MISSING:
+        value = producer()
+        cache.set(key, value, version, ttl)
+    return value
+
+
+def invalidate_user(user_id):
+    current_app.extensions["cache"].invalidate(cache_key(user_id, "session", "user"))
+
+
+def invalidate_views(user_id, *dates):
+    keys = set()
+    for date in dates:
+        keys.add(cache_key(user_id, date[:4], "dashboard"))
+        keys.add(cache_key(user_id, month_of(date), "month"))
+    if keys:
+        keys.add(cache_key(user_id, datetime.date.today().isoformat(), "analytics"))
+    current_app.extensions["cache"].invalidate(*keys)
@@ -0,0 +1,226 @@
+import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from headhouse_library.archive import archive_year, year_query
+from headhouse_library.database import create_budget_index, create_indexes
+from headhouse_library.importer import DATE_ORDERS, EXPENSE_SIGNS, import_expenses
+from headhouse_library.summaries import rebuild_summaries, record_budgets
+from headhouse_library.ledger import changed
+
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@click.command("create-indexes")
+@with_appcontext
+def create_indexes_command():
+    """Create the indexes ahead of deployment; workers otherwise create them on their first request."""
+    create_indexes(current_app.db)
+    click.echo("Indexes are up to date.")
+
+
+@click.command("migrate-owners")
+@click.option("--batch-size", default=1000, show_default=True, help="IDs updated per write.")
+@with_appcontext
+def migrate_owners(batch_size):
+    """Move the legacy per-user ID arrays onto expense/budget `user_id` fields.
+
+    Users are unset from the legacy arrays once all their documents are
+    tagged, so an interrupted run can simply be started again.
+    """
+    db = current_app.db
+    legacy_users = {"$or": [{"expenses": {"$exists": True}}, {"budgets": {"$exists": True}}]}
+    total_users = db.user.count_documents(legacy_users)
+
+    if total_users == 0:
+        click.echo("Nothing to migrate.")
+        return
+
+    migrated = {"expense": 0, "budget": 0}
+    cursor = db.user.find(legacy_users, {"expenses": 1, "budgets": 1}).sort("_id")
+    for position, user in enumerate(cursor, start=1):
+        for collection, field in (("expense", "expenses"), ("budget", "budgets")):
+            for ids in batched(user.get(field, []), batch_size):
+                result = db[collection].update_many(
+                    {"_id": {"$in": ids}, "user_id": {"$exists": False}},
+                    {"$set": {"user_id": user["_id"]}}
+                )
+                migrated[collection] += result.modified_count
+
+        db.user.update_one({"_id": user["_id"]}, {"$unset": {"expenses": "", "budgets": ""}})
+        click.echo(
+            f"[{position}/{total_users}] {user['_id']}: "
+            f"{len(user.get('expenses', []))} expenses, {len(user.get('budgets', []))} budgets"
+        )
+
+    click.echo(f"Done. Tagged {migrated['expense']} expenses and {migrated['budget']} budgets.")
+
+
+@click.command("rebuild-summaries")
+@click.option("--user", "user_ids", multiple=True, help="Only rebuild these user IDs.")
+@click.option("--check", is_flag=True, help="Report drift without rewriting summaries.")
+@with_appcontext
+def rebuild_summaries_command(user_ids, check):
+    """Recompute the monthly_summary rollup from raw expenses and budgets."""
+    db = current_app.db
+    if not user_ids:
+        user_ids = (user["_id"] for user in db.user.find({}, {"_id": 1}))
+
+    checked = 0
+    drifted_months = 0
+    for user_id in user_ids:
+        drifted = rebuild_summaries(db, user_id, write=not check)
+        checked += 1
+        drifted_months += len(drifted)
+        for month, fields in drifted.items():
+            click.echo(f"{user_id} {month}: {', '.join(fields)}")
+
+    report = f"Checked {checked} users, {'found' if check else 'fixed'} drift in {drifted_months} monthly summaries."
+    if check and drifted_months:
+        raise click.ClickException(report)
+    click.echo(report)
+
+
+@click.command("import-expenses")
+@click.argument("csv_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--email", required=True, help="Account the expenses belong to.")
+@click.option("--batch-size", default=None, type=int, help="Rows per insert_many, defaults to IMPORT_BATCH_SIZE.")
+@click.option("--delimiter", default=",", show_default=True)
+@click.option("--column", "columns", multiple=True, metavar="FIELD=HEADER",
+              help="Map an expense field (date, title, type, amount) to a CSV header.")
+@click.option("--expense-sign", type=click.Choice(list(EXPENSE_SIGNS)), default="positive", show_default=True,
+              help="Sign of the amounts that are expenses; rows of the other sign are reported and skipped.")
+@click.option("--date-order", type=click.Choice(list(DATE_ORDERS)), default="auto", show_default=True,
+              help="How to read dates like 02.03.2021; auto reports them as ambiguous.")
+@with_appcontext
+def import_expenses_command(csv_file, email, batch_size, delimiter, columns, expense_sign, date_order):
+    """Stream a CSV/bank export into the account's expenses."""
+    user = current_app.db.user.find_one({"email": email}, {"_id": 1})
+    if user is None:
+        raise click.ClickException(f"No user with email {email}.")
+
+    mapping = {}
+    for column in columns:
+        field, _, header = column.partition("=")
+        if field not in ("date", "title", "type", "amount") or not header:
+            raise click.BadParameter(f"{column!r} is not FIELD=HEADER.", param_hint="--column")
+        mapping[field] = header
+
+    with open(csv_file, newline="", encoding="utf-8-sig") as lines:
+        report = import_expenses(
+            current_app.db,
+            user["_id"],
+            lines,
+            columns=mapping,
+            batch_size=batch_size or current_app.config["IMPORT_BATCH_SIZE"],
+            delimiter=delimiter,
+            expense_sign=expense_sign,
+            date_order=date_order
+        )
+    if report.imported:
+        changed(current_app.db, user["_id"], *report.months)
+
+    for line, message in report.errors:
+        click.echo(f"line {line}: {message}", err=True)
+    if report.failed > len(report.errors):
+        click.echo(f"... and {report.failed - len(report.errors)} more errors", err=True)
+    click.echo(
+        f"Imported {report.imported} expenses, {report.failed} failed, "
+        f"{report.seconds:.1f}s ({report.rows_per_second:.0f} rows/s)."
+    )
+
+
+@click.command("clean-budgets")
+@click.option("--zero", "remove_zero", is_flag=True, help="Also remove owned budgets of 0, which read the same as none.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be removed.")
+@click.option("--batch-size", default=1000, show_default=True, help="IDs removed per delete.")
+@with_appcontext
+def clean_budgets(remove_zero, dry_run, batch_size):
+    """Remove orphaned and duplicate budgets, then enforce one budget per user and month."""
+    db = current_app.db
+    legacy_users = db.user.count_documents({"$or": [{"expenses": {"$exists": True}}, {"budgets": {"$exists": True}}]})
+    if legacy_users:
+        # Until then budgets without a user_id are the legacy ones, not orphans.
+        raise click.ClickException(
+            f"{legacy_users} users still have legacy expense/budget arrays, run `flask migrate-owners` first."
+        )
+
+    removed = {"orphaned": 0, "duplicate": 0, "zero": 0}
+
+    def remove(kind, query):
+        if dry_run:
+            removed[kind] += db.budget.count_documents(query)
+        else:
+            removed[kind] += db.budget.delete_many(query).deleted_count
+
+    remove("orphaned", {"user_id": {"$exists": False}})
+    user_ids = set(db.budget.distinct("user_id"))
+    known_ids = {user["_id"] for user in db.user.find({"_id": {"$in": list(user_ids)}}, {"_id": 1})}
+    for ids in batched(sorted(user_ids - known_ids), batch_size):
+        remove("orphaned", {"user_id": {"$in": ids}})
+
+    duplicates = db.budget.aggregate([
+        {"$match": {"user_id": {"$in": list(known_ids)}}},
+        {
+            "$group": {
+                "_id": {"user_id": "$user_id", "date": "$date"},
+                "budgets": {"$push": {"_id": "$_id", "amount": "$amount"}},
+                "count": {"$sum": 1}
+            }
+        },
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    for group in duplicates:
+        user_id, date = group["_id"]["user_id"], group["_id"]["date"]
+        keep = max(group["budgets"], key=lambda budget: budget["amount"])
+        extra_ids = [budget["_id"] for budget in group["budgets"] if budget["_id"] != keep["_id"]]
+        remove("duplicate", {"_id": {"$in": extra_ids}})
+        if not dry_run:
+            record_budgets(db, user_id, {date: keep["amount"]})
+
+    if remove_zero:
+        remove("zero", {"amount": 0})
+
+    verb = "Would remove" if dry_run else "Removed"
+    click.echo(f"{verb} {removed['orphaned']} orphaned, {removed['duplicate']} duplicate "
+               f"and {removed['zero']} zero budgets.")
+    if not dry_run:
+        unique = create_budget_index(db, rebuild=True)
+        click.echo("Budgets are unique per user and month." if unique else "Duplicates remain, index not unique yet.")
+
+
+@click.command("archive-expenses")
+@click.option("--before", type=int, help="Archive years before this one.  [default: the current year]")
+@click.option("--user", "user_ids", multiple=True, help="Only archive these user IDs.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be archived.")
+@with_appcontext
+def archive_expenses(before, user_ids, dry_run):
+    """Move expenses of closed years into one compressed document per user and year.
+
+    Summaries keep the archived totals, and a later write to an archived year
+    moves that year back into `expense` first.
+    """
+    db = current_app.db
+    current_year = datetime.date.today().year
+    before = before or current_year
+    if before > current_year:
+        raise click.BadParameter("only closed years can be archived.", param_hint="--before")
+
+    user_ids = list(user_ids) or db.expense.distinct("user_id", {"date": {"$lt": f"{before}-01-01"}})
+    archived_years = archived_expenses = 0
+    for user_id in user_ids:
+        dates = db.expense.distinct("date", {"user_id": user_id, "date": {"$lt": f"{before}-01-01"}})
+        for year in sorted({int(date[:4]) for date in dates}):
+            if dry_run:
+                moved = db.expense.count_documents(year_query(user_id, year))
+            else:
+                moved = archive_year(db, user_id, year)
+            archived_years += 1
+            archived_expenses += moved
+
+    verb = "Would archive" if dry_run else "Archived"
+    click.echo(f"{verb} {archived_expenses} expenses in {archived_years} user-years before {before}.")
@@ -0,0 +1,60 @@
+import datetime
+
+from headhouse_library.summaries import get_summaries, sorted_categories
+
+
+def get_dashboard(db, user_id, year):
+    months = {
+        datetime.date(year=year, month=month, day=1).isoformat(): {"spent": 0, "budget": 0}
+        for month in range(1, 13)
+    }
+    category_expenses = {}
+
+    for summary in get_summaries(db, user_id, f"{year}-01-01", f"{year}-12-01"):
+        months[summary["month"]]["spent"] += summary.get("spent", 0)
+        months[summary["month"]]["budget"] += summary.get("budget", 0)
+        for category, amount in summary.get("categories", {}).items():
+            category_expenses[category] = category_expenses.get(category, 0) + amount
+
+    return {
+        "total_budget": round(sum(figures["budget"] for figures in months.values()), 2),
+        "total_expenses": round(sum(figures["spent"] for figures in months.values()), 2),
+        "category_expenses": sorted_categories(category_expenses),
+        "months": [
+            {
+                "date": datetime.date.fromisoformat(month),
+                "spent": round(figures["spent"], 2),
+                "budget": round(figures["budget"], 2),
+                "left": round(figures["budget"] - figures["spent"], 2)
+            }
+            for month, figures in sorted(months.items())
+        ]
+    }
+
+
+def add_projected(dashboard, projected):
+    """Return a copy of get_dashboard()'s result with projected recurring expenses counted in."""
+    if not projected:
+        return dashboard
+
+    category_expenses = dict(dashboard["category_expenses"])
+    for totals in projected.values():
+        for category, amount in totals["categories"].items():
+            category_expenses[category] = category_expenses.get(category, 0) + amount
+
+    months = []
+    for month in dashboard["months"]:
+        extra = projected.get(month["date"].isoformat(), {}).get("spent", 0)
+        months.append({
+            **month,
+            "spent": round(month["spent"] + extra, 2),
+            "left": round(month["left"] - extra, 2),
+            "projected": round(extra, 2)
+        })
+
+    return {
+        **dashboard,
+        "total_expenses": round(dashboard["total_expenses"] + sum(totals["spent"] for totals in projected.values()), 2),
+        "category_expenses": sorted_categories(category_expenses),
+        "months": months
+    }
@@ -0,0 +1,249 @@
+import logging
+import os
+import threading
+import time
+from flask import current_app, has_request_context, jsonify, request, session
+from pymongo import ASCENDING, MongoClient, monitoring
+from pymongo.errors import OperationFailure, PyMongoError
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connections of the current process' pools for the readiness endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"open": 0, "in_use": 0, "checkout_failures": 0, "pool_clears": 0}
+
+    def _add(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+
+    def connection_created(self, event):
+        self._add("open")
+
+    def connection_closed(self, event):
+        self._add("open", -1)
+
+    def connection_checked_out(self, event):
+        self._add("in_use")
+
+    def connection_checked_in(self, event):
+        self._add("in_use", -1)
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def pool_cleared(self, event):
+        self._add("pool_clears")
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+class Mongo:
+    """Creates the MongoClient lazily in each process, so forked gunicorn workers never share one."""
+
+    def __init__(self, app=None, event_listeners=()):
+        self._client = None
+        self._pid = None
+        self._indexes_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, event_listeners)
+
+    def init_app(self, app, event_listeners=()):
+        config = app.config
+        config.setdefault("MONGO_MAX_POOL_SIZE", 50)
+        config.setdefault("MONGO_MIN_POOL_SIZE", 0)
+        config.setdefault("MONGO_CONNECT_TIMEOUT_MS", 5000)
+        config.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+        config.setdefault("MONGO_SOCKET_TIMEOUT_MS", None)
+        config.setdefault("MONGO_COMPRESSORS", None)
+        config.setdefault("MONGO_READ_PREFERENCE", "primary")
+        config.setdefault("MONGO_MAX_STALENESS_SECONDS", -1)
+        config.setdefault("MONGO_READ_YOUR_WRITES_SECONDS", 120)
+        config.setdefault("MONGO_CREATE_INDEXES", True)
+
+        self.uri = config["MONGODB_URI"]
+        self.pool_monitor = PoolMonitor()
+        self.event_listeners = [*event_listeners, self.pool_monitor]
+        self.options = {
+            "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+            "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+            "connectTimeoutMS": config["MONGO_CONNECT_TIMEOUT_MS"],
+            "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+            "socketTimeoutMS": config["MONGO_SOCKET_TIMEOUT_MS"]
+        }
+        if config["MONGO_COMPRESSORS"]:
+            self.options["compressors"] = config["MONGO_COMPRESSORS"]
+
+        self.read_preference = make_read_preference(
+            read_pref_mode_from_name(config["MONGO_READ_PREFERENCE"]),
+            None,
+            max_staleness=config["MONGO_MAX_STALENESS_SECONDS"]
+        ) if config["MONGO_READ_PREFERENCE"] != "primary" else None
+        app.add_url_rule("/readyz", "readyz", self.readiness_view)
+        app.before_request(self.ensure_indexes)
+        app.extensions["mongo"] = self
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self.pool_monitor.counters.update(open=0, in_use=0)
+                self._client = MongoClient(self.uri, event_listeners=self.event_listeners, **self.options)
+                self._pid = os.getpid()
+            return self._client
+
+    @property
+    def db(self):
+        return self.client.get_default_database()
+
+    @property
+    def read_db(self):
+        if self.read_preference is None:
+            return self.db
+        return self.db.with_options(read_preference=self.read_preference)
+
+    def health(self):
+        started = time.perf_counter()
+        self.client.admin.command("ping")
+        ping_ms = (time.perf_counter() - started) * 1000
+
+        return {
+            "pid": os.getpid(),
+            "ping_ms": round(ping_ms, 2),
+            "pool": {
+                "max_size": self.options["maxPoolSize"],
+                "min_size": self.options["minPoolSize"],
+                **self.pool_monitor.counters
+            },
+            "read_preference": self.read_preference.name if self.read_preference else "primary",
+            "servers": [
+                {
+                    "type": server.server_type_name,
+                    "round_trip_ms": round(server.round_trip_time * 1000, 2) if server.round_trip_time else None
+                }
+                for server in self.client.topology_description.server_descriptions().values()
+            ]
+        }
+
+    def ensure_indexes(self):
+        """Create indexes on each worker's first request rather than in create_app, so
+        starting (or forking) never connects and the app comes up while MongoDB is down."""
+        if (
+            self._indexes_pid == os.getpid()
+            or not current_app.config["MONGO_CREATE_INDEXES"]
+            or request.endpoint in ("readyz", "static")
+        ):
+            return
+        try:
+            create_indexes(current_app.db)
+        except PyMongoError:
+            logger.exception("Creating indexes failed, retrying on the next request.")
+            return
+        self._indexes_pid = os.getpid()
+
+    def readiness_view(self):
+        try:
+            health = self.health()
+        except PyMongoError as error:
+            return jsonify(status="unavailable", pid=os.getpid(), error=type(error).__name__), 503
+        return jsonify(status="ok", **health)
+
+
+class DatabaseProxy:
+    """Stands in for `app.db`/`app.read_db` and resolves the process' database on every use."""
+
+    def __init__(self, mongo, reads=False):
+        self._mongo = mongo
+        self._reads = reads
+
+    def _database(self):
+        return self._mongo.read_db if self._reads else self._mongo.db
+
+    def __getattr__(self, name):
+        return getattr(self._database(), name)
+
+    def __getitem__(self, name):
+        return self._database()[name]
+
+
+def mark_write():
+    if has_request_context():
+        session["last_write"] = time.time()
+
+
+def read_db():
+    """Database for read-heavy views; falls back to the primary right after this session wrote."""
+    last_write = session.get("last_write", 0) if has_request_context() else 0
+    if time.time() - last_write < current_app.config["MONGO_READ_YOUR_WRITES_SECONDS"]:
+        return current_app.db
+    return current_app.read_db
+
+
+BUDGET_INDEX = "user_id_1_date_1"
+# Sent-alert keys expire after this long; a limit reached in a month older than that may alert again.
+ALERT_LOG_TTL_SECONDS = 400 * 24 * 3600
+
+
+def create_budget_index(db, rebuild=False):
+    """Make budgets unique per (user, month); return False while duplicates still block it.
+
+    Only `rebuild` (used by clean-budgets) replaces an existing non-unique index. At startup
+    workers merely create a missing index, so they never drop one another is building.
+    """
+    keys = [("user_id", ASCENDING), ("date", ASCENDING)]
+    existing = db.budget.index_information().get(BUDGET_INDEX)
+    if existing and (existing.get("unique") or not rebuild):
+        return bool(existing.get("unique"))
+
+    if existing:
+        db.budget.drop_index(BUDGET_INDEX)
+    try:
+        db.budget.create_index(keys, name=BUDGET_INDEX, unique=True)
+        return True
+    except OperationFailure as error:
+        if error.code != 11000:
+            raise
+        logger.warning(
+            "Duplicate budgets prevent the unique (user_id, date) index, run `flask clean-budgets`."
+        )
+        db.budget.create_index(keys, name=BUDGET_INDEX)
+        return False
+
+
+def create_indexes(db):
+    db.expense.create_index([("user_id", ASCENDING), ("date", ASCENDING)])
+    for sort_field in ("amount", "title"):
+        db.expense.create_index(
+            [("user_id", ASCENDING), ("date", ASCENDING), (sort_field, ASCENDING), ("_id", ASCENDING)]
+        )
+    db.expense.create_index(
+        [("user_id", ASCENDING), ("date", ASCENDING), ("type", ASCENDING), ("amount", ASCENDING), ("_id", ASCENDING)]
+    )
+    create_budget_index(db)
+    db.monthly_summary.create_index(
+        [("user_id", ASCENDING), ("month", ASCENDING)], unique=True
+    )
+    db.user.create_index("email")
+    db.notification.create_index([("user_id", ASCENDING), ("created", ASCENDING)])
+    db.alert_log.create_index("created", expireAfterSeconds=ALERT_LOG_TTL_SECONDS)
+    db.expense_archive.create_index([("user_id", ASCENDING), ("year", ASCENDING)])
+    db.expense.create_index([("rule_id", ASCENDING), ("date", ASCENDING)], sparse=True)
+    db.recurring_rule.create_index([("user_id", ASCENDING), ("start", ASCENDING)])
@@ -0,0 +1,75 @@
+import csv
+import heapq
+import io
+import json
+
+EXPORT_FIELDS = ["date", "title", "type", "amount"]
+CHUNK_SIZE = 64 * 1024
+
+
+def export_query(user_id, start=None, end=None, types=None):
+    query = {"user_id": user_id}
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    if types:
+        query["type"] = {"$in": types}
+    return query
+
+
+def export_cursor(db, query, batch_size=1000):
+    projection = {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}}
+    return db.expense.find(query, projection, batch_size=batch_size).sort("date", 1)
+
+
+def merge_archived(cursor, archived):
+    """Interleave archived expenses with the cursor; both are already in date order."""
+    archived = ({field: expense[field] for field in EXPORT_FIELDS} for expense in archived)
+    return heapq.merge(archived, cursor, key=lambda expense: expense["date"])
+
+
+def csv_lines(cursor):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for expense in cursor:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerow(expense)
+        yield buffer.getvalue()
+
+
+def ndjson_lines(cursor):
+    for expense in cursor:
+        yield json.dumps(expense) + "\n"
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    """Join lines into chunks of roughly `size` characters; the first line goes out alone."""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is not None:
+        yield first
+
+    chunk = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield "".join(chunk)
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", csv_lines),
+    "ndjson": ("application/x-ndjson", ndjson_lines)
+}
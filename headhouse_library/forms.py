@@ -1,6 +1,19 @@
 from flask_wtf import FlaskForm
-from wtforms import FloatField, StringField, SubmitField, TextAreaField, SelectField, URLField, PasswordField
-from wtforms.validators import InputRequired, NumberRange, Email, Length, EqualTo
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import FloatField, MonthField, StringField, SubmitField, TextAreaField, SelectField, URLField, PasswordField
+from wtforms.validators import InputRequired, NumberRange, Email, Length, EqualTo, Optional, ValidationError
+
+EXPENSE_TYPES = [
+    'Food',
+    'Loans',
+    'Housing/Rent expenses',
+    'Media and communication',
+    'Travel and vacations',
+    'Donations and gifts',
+    'Entertainment and hobbies',
+    'Shopping',
+    'Other'
+]
 
 class BudgetForm(FlaskForm):
     amount = FloatField(
@@ -15,27 +28,39 @@ class BudgetForm(FlaskForm):
 
 class ExpenseForm(FlaskForm):
     title = StringField("Title", validators = [InputRequired()])
-    type = SelectField('Type', choices=[
-        ('Food', 'Food'), 
-        ('Loans', 'Loans'),
-        ('Housing/Rent expenses', 'Housing/Rent expenses'), 
-        ('Media and communication', 'Media and communication'),  
-        ('Travel and vacations', 'Travel and vacations'),
-        ('Donations and gifts', 'Donations and gifts'),
-        ('Entertainment and hobbies', 'Entertainment and hobbies'),
-        ('Shopping', 'Shopping'),
-        ('Other', 'Other')
+    type = SelectField('Type', choices=[(expense_type, expense_type) for expense_type in EXPENSE_TYPES])
+
+    amount = FloatField(
+        "Amount",
+        validators=[InputRequired(),
+                    NumberRange(min=0.01, message="Dont add empty expense")
         ]
     )
 
+    submit = SubmitField("Submit Expense")
+
+
+FREQUENCIES = {"monthly": 1, "quarterly": 3, "yearly": 12}
+
+
+class RecurringRuleForm(FlaskForm):
+    title = StringField("Title", validators=[InputRequired()])
+    type = SelectField("Type", choices=[(expense_type, expense_type) for expense_type in EXPENSE_TYPES])
     amount = FloatField(
         "Amount",
         validators=[InputRequired(),
                     NumberRange(min=0.01, message="Dont add empty expense")
         ]
     )
+    frequency = SelectField("Frequency", choices=[(frequency, frequency.capitalize()) for frequency in FREQUENCIES])
+    start = MonthField("First month", validators=[InputRequired()])
+    end = MonthField("Last month (optional)", validators=[Optional()])
 
-    submit = SubmitField("Submit Expense")
+    submit = SubmitField("Save")
+
+    def validate_end(self, field):
+        if field.data and self.start.data and field.data < self.start.data:
+            raise ValidationError("The last month can't be before the first one.")
 
 
 class RegisterForm(FlaskForm):
@@ -63,4 +88,39 @@ class LoginForm(FlaskForm):
     submit = SubmitField("Login")
 
 class DeleteExpenseForm(FlaskForm):
-    submit = SubmitField('Delete')
\ No newline at end of file
+    submit = SubmitField('Delete')
+
+class ImportExpensesForm(FlaskForm):
+    file = FileField(
+        "CSV file",
+        validators=[FileRequired(), FileAllowed(["csv", "txt"], "Only CSV files can be imported.")]
+    )
+    delimiter = SelectField("Delimiter", choices=[(",", "Comma"), (";", "Semicolon"), ("\t", "Tab")])
+    date_column = StringField("Date column", default="date", validators=[InputRequired()])
+    title_column = StringField("Title column", default="title", validators=[InputRequired()])
+    type_column = StringField("Type column", default="type", validators=[InputRequired()])
+    amount_column = StringField("Amount column", default="amount", validators=[InputRequired()])
+    expense_sign = SelectField(
+        "Expenses are",
+        choices=[("positive", "Positive amounts"), ("negative", "Negative amounts (bank exports)")],
+        default="positive"
+    )
+    date_order = SelectField(
+        "Dates are",
+        choices=[
+            ("auto", "Year first (2021-03-02) or unambiguous"),
+            ("day-first", "Day first (02.03.2021)"),
+            ("month-first", "Month first (03/02/2021)")
+        ],
+        default="auto"
+    )
+    submit = SubmitField("Import")
+
+
+class CategoryCapsForm(FlaskForm):
+    submit = SubmitField("Save caps")
+
+# One optional monthly cap per category, named cap_0, cap_1, ... in EXPENSE_TYPES order.
+CAP_FIELDS = {expense_type: f"cap_{position}" for position, expense_type in enumerate(EXPENSE_TYPES)}
+for expense_type, field_name in CAP_FIELDS.items():
+    setattr(CategoryCapsForm, field_name, FloatField(expense_type, validators=[Optional(), NumberRange(min=0)]))
@@ -0,0 +1,137 @@
+import csv
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from dateutil import parser
+from pymongo.errors import BulkWriteError
+
+from headhouse_library.forms import EXPENSE_TYPES
+from headhouse_library.models import Expense
+from headhouse_library.summaries import record_expenses
+
+DEFAULT_COLUMNS = {"date": "date", "title": "title", "type": "type", "amount": "amount"}
+MAX_REPORTED_ERRORS = 100
+# Sign of the rows that are expenses; rows of the other sign (salary, refunds) are skipped.
+EXPENSE_SIGNS = {"positive": 1, "negative": -1}
+# How to read dates such as 02.03.2021; "auto" rejects them unless both readings agree.
+# Dates starting with the year (2021-03-02) are always read year, month, day.
+DATE_ORDERS = {"auto": None, "day-first": True, "month-first": False}
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    failed: int = 0
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    months: set[str] = field(default_factory=set)
+    seconds: float = 0
+
+    @property
+    def rows_per_second(self):
+        return (self.imported + self.failed) / self.seconds if self.seconds else 0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def parse_date(text, date_order="auto"):
+    try:
+        text = text.strip()
+        if text[:4].isdigit():
+            return parser.parse(text, yearfirst=True).date()
+        if DATE_ORDERS[date_order] is not None:
+            return parser.parse(text, dayfirst=DATE_ORDERS[date_order]).date()
+        day_first = parser.parse(text, dayfirst=True).date()
+        month_first = parser.parse(text, dayfirst=False).date()
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        raise ValueError(f"invalid date {text!r}")
+    if day_first != month_first:
+        raise ValueError(f"ambiguous date {text!r}, choose day-first or month-first dates")
+    return day_first
+
+
+def parse_amount(text):
+    """Read 12.5, 12,5, 1 234,56, 1.234,56 or 1,234.56; with both separators the last one is decimal."""
+    text = "".join(text.split())
+    if "," in text and "." in text:
+        text = text.replace("," if text.rindex(".") > text.rindex(",") else ".", "")
+    elif text.count(".") > 1 or text.count(",") > 1:
+        text = text.replace(".", "").replace(",", "")
+    return float(text.replace(",", "."))
+
+
+def parse_row(row, columns, user_id, expense_sign="positive", date_order="auto"):
+    date = parse_date(row.get(columns["date"]), date_order)
+
+    try:
+        amount = parse_amount(row[columns["amount"]]) * EXPENSE_SIGNS[expense_sign]
+    except (KeyError, AttributeError, ValueError):
+        raise ValueError(f"invalid amount {row.get(columns['amount'])!r}")
+    if amount < 0:
+        raise ValueError(f"credit of {-amount:.2f} skipped, only {expense_sign} amounts are expenses")
+    if amount < 0.01:
+        raise ValueError("Dont add empty expense")
+
+    expense_type = (row.get(columns["type"]) or "").strip()
+    if expense_type not in EXPENSE_TYPES:
+        raise ValueError(f"unknown type {expense_type!r}")
+
+    title = (row.get(columns["title"]) or "").strip()
+    if not title:
+        raise ValueError("missing title")
+
+    return Expense(
+        _id=uuid.uuid4().hex,
+        user_id=user_id,
+        title=title.capitalize(),
+        type=expense_type,
+        amount=round(amount, 2),
+        date=date.replace(day=1).isoformat()
+    )
+
+
+def write_batch(db, user_id, batch, report):
+    documents = [asdict(expense) for _, expense in batch]
+    failed_indexes = set()
+    try:
+        db.expense.insert_many(documents, ordered=False)
+    except BulkWriteError as error:
+        for write_error in error.details["writeErrors"]:
+            failed_indexes.add(write_error["index"])
+            report.add_error(batch[write_error["index"]][0], write_error["errmsg"])
+
+    inserted = [document for index, document in enumerate(documents) if index not in failed_indexes]
+    report.imported += len(inserted)
+    report.months.update(record_expenses(db, user_id, inserted))
+
+
+def import_expenses(db, user_id, lines, columns=None, batch_size=1000, delimiter=",", expense_sign="positive",
+                    date_order="auto"):
+    """Stream rows from an iterable of CSV lines into `expense` in unordered batches.
+
+    Only the current batch and the first MAX_REPORTED_ERRORS errors are kept
+    in memory, so the file size does not matter.
+    """
+    columns = {**DEFAULT_COLUMNS, **(columns or {})}
+    report = ImportReport()
+    start = time.perf_counter()
+
+    batch = []
+    reader = csv.DictReader(lines, delimiter=delimiter)
+    for row in reader:
+        try:
+            batch.append((reader.line_num, parse_row(row, columns, user_id, expense_sign, date_order)))
+        except ValueError as error:
+            report.add_error(reader.line_num, str(error))
+
+        if len(batch) >= batch_size:
+            write_batch(db, user_id, batch, report)
+            batch = []
+
+    if batch:
+        write_batch(db, user_id, batch, report)
+
+    report.seconds = time.perf_counter() - start
+    return report
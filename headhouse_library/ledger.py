@@ -0,0 +1,113 @@
+import uuid
+from dataclasses import asdict
+from pymongo import ReturnDocument, UpdateOne
+
+from headhouse_library import archive, summaries
+from headhouse_library.alerts import queue_alerts
+from headhouse_library.cache import invalidate_views
+from headhouse_library.database import mark_write
+
+
+def changed(db, user_id, *dates):
+    """Bookkeeping shared by every write: reopen archived years it touched, drop cached views,
+    bump the user's revision, pin the session's reads to the primary until secondaries have
+    caught up and queue alert checks."""
+    archive.reopen(db, user_id, dates)
+    invalidate_views(user_id, *dates)
+    mark_write()
+    db.user.update_one({"_id": user_id}, {"$inc": {"revision": 1}})
+    queue_alerts(user_id, *dates)
+
+
+def get_revision(db, user_id):
+    user = db.user.find_one({"_id": user_id}, {"revision": 1})
+    return (user or {}).get("revision", 0)
+
+
+def add_expenses(db, user_id, expenses):
+    documents = [asdict(expense) for expense in expenses]
+    if not documents:
+        return []
+
+    db.expense.insert_many(documents, ordered=False)
+    months = summaries.record_expenses(db, user_id, documents)
+    changed(db, user_id, *months)
+    return documents
+
+
+def update_expenses(db, user_id, updates, dates=()):
+    """Apply {expense_id: fields} updates; return the updated documents, skipping unknown IDs.
+
+    IDs missing from `expense` are retried after reopening the archived years of `dates`,
+    the months the caller knows they belong to; without dates they are skipped.
+    """
+    deltas = {}
+    updated = []
+
+    def apply(expense_ids):
+        missing = []
+        for expense_id in expense_ids:
+            previous = db.expense.find_one_and_update(
+                {"_id": expense_id, "user_id": user_id},
+                {"$set": updates[expense_id]},
+                return_document=ReturnDocument.BEFORE
+            )
+            if previous is None:
+                missing.append(expense_id)
+                continue
+
+            current = {**previous, **updates[expense_id]}
+            summaries.add_delta(deltas, previous, sign=-1)
+            summaries.add_delta(deltas, current)
+            updated.append(current)
+        return missing
+
+    missing = apply(updates)
+    if missing and archive.reopen(db, user_id, dates):
+        apply(missing)
+
+    if updated:
+        months = summaries.apply_deltas(db, user_id, deltas)
+        changed(db, user_id, *months)
+    return updated
+
+
+def delete_expenses(db, user_id, expense_ids, dates=()):
+    """Delete expenses by ID, reopening archived years of `dates` like update_expenses()."""
+    deleted = []
+
+    def apply(expense_ids):
+        missing = []
+        for expense_id in expense_ids:
+            expense = db.expense.find_one_and_delete({"_id": expense_id, "user_id": user_id})
+            if expense is None:
+                missing.append(expense_id)
+            else:
+                deleted.append(expense)
+        return missing
+
+    missing = apply(expense_ids)
+    if missing and archive.reopen(db, user_id, dates):
+        apply(missing)
+
+    if deleted:
+        months = summaries.record_expenses(db, user_id, deleted, sign=-1)
+        changed(db, user_id, *months)
+    return deleted
+
+
+def set_budgets(db, user_id, amounts):
+    """Set the budgets of several months, given as {date: amount}, with one upsert per month."""
+    if not amounts:
+        return
+
+    db.budget.bulk_write([
+        UpdateOne(
+            {"user_id": user_id, "date": date},
+            {"$set": {"amount": amount}, "$setOnInsert": {"_id": uuid.uuid4().hex}},
+            upsert=True
+        )
+        for date, amount in amounts.items()
+    ], ordered=False)
+    summaries.record_budgets(db, user_id, amounts)
+    changed(db, user_id, *amounts)
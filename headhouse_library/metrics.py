@@ -0,0 +1,189 @@
+import bisect
+import threading
+import time
+from collections import deque
+from flask import Response, current_app, g, request, session, abort
+from flask.signals import before_render_template, template_rendered
+from pymongo import monitoring
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                labels = ",".join(
+                    f'{label}="{str(value)}"' for label, value in zip(self.labels, label_values)
+                )
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total}")
+                lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+def filter_shape(value):
+    """Replace literal values with their type so samples never leak user data."""
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [filter_shape(item) for item in value[:3]]
+    return type(value).__name__
+
+
+class RequestStats(threading.local):
+    def __init__(self):
+        self.reset()
+
+    def reset(self, endpoint=None):
+        self.endpoint = endpoint
+        self.commands = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_starts = []
+        self.pending = {}
+
+
+class CommandTimer(monitoring.CommandListener):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        self.metrics.stats.pending[event.request_id] = event.command
+
+    def succeeded(self, event):
+        self.metrics.command_finished(event)
+
+    def failed(self, event):
+        self.metrics.command_finished(event)
+
+
+class Metrics:
+    """Per-endpoint, per-Mongo-command and template timings, exposed at /metrics."""
+
+    def __init__(self, app=None):
+        self.stats = RequestStats()
+        self.command_listener = CommandTimer(self)
+        self.slow_queries = deque(maxlen=50)
+        self.request_duration = Histogram(
+            "headhouse_request_duration_seconds", "Time spent handling a request.",
+            ("endpoint", "method", "status")
+        )
+        self.command_duration = Histogram(
+            "headhouse_mongo_command_duration_seconds", "Time spent in MongoDB commands.",
+            ("command", "collection")
+        )
+        self.request_commands = Histogram(
+            "headhouse_mongo_commands_per_request", "MongoDB commands issued per request.",
+            ("endpoint",), buckets=COUNT_BUCKETS
+        )
+        self.template_duration = Histogram(
+            "headhouse_template_render_duration_seconds", "Time spent rendering templates.",
+            ("template",)
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_SERVER_TIMING", False)
+        app.config.setdefault("METRICS_SLOW_QUERY_MS", 100)
+        app.config.setdefault("METRICS_TOKEN", None)
+        self.slow_query_seconds = app.config["METRICS_SLOW_QUERY_MS"] / 1000
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        before_render_template.connect(self.template_started, app)
+        template_rendered.connect(self.template_finished, app)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+        app.extensions["metrics"] = self
+
+    def before_request(self):
+        self.stats.reset(request.endpoint)
+        g.request_started = time.perf_counter()
+
+    def after_request(self, response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+
+        duration = time.perf_counter() - started
+        endpoint = request.endpoint or "unknown"
+        self.request_duration.observe(duration, endpoint, request.method, response.status_code)
+        self.request_commands.observe(self.stats.commands, endpoint)
+
+        if current_app.config["METRICS_SERVER_TIMING"]:
+            response.headers["Server-Timing"] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={self.stats.db_seconds * 1000:.1f};desc="{self.stats.commands} commands", '
+                f'tpl;dur={self.stats.template_seconds * 1000:.1f}'
+            )
+        return response
+
+    def command_finished(self, event):
+        seconds = event.duration_micros / 1_000_000
+        command = self.stats.pending.pop(event.request_id, None) or {}
+        collection = command.get(event.command_name)
+        collection = collection if isinstance(collection, str) else ""
+
+        self.stats.commands += 1
+        self.stats.db_seconds += seconds
+        self.command_duration.observe(seconds, event.command_name, collection)
+
+        if seconds >= self.slow_query_seconds:
+            shape = {
+                key: filter_shape(command[key])
+                for key in ("filter", "pipeline", "query", "updates", "sort")
+                if key in command
+            }
+            self.slow_queries.append({
+                "command": event.command_name,
+                "collection": collection,
+                "endpoint": self.stats.endpoint,
+                "duration_ms": round(seconds * 1000, 2),
+                "shape": shape
+            })
+
+    def template_started(self, sender, template, context, **extra):
+        self.stats.template_starts.append(time.perf_counter())
+
+    def template_finished(self, sender, template, context, **extra):
+        if not self.stats.template_starts:
+            return
+        seconds = time.perf_counter() - self.stats.template_starts.pop()
+        self.stats.template_seconds += seconds
+        self.template_duration.observe(seconds, template.name or "string")
+
+    def metrics_view(self):
+        token = current_app.config["METRICS_TOKEN"]
+        if token:
+            if request.headers.get("Authorization") != f"Bearer {token}":
+                abort(401)
+        elif session.get("email") not in current_app.config["ADMIN_EMAILS"]:
+            abort(404)
+
+        lines = []
+        for histogram in (self.request_duration, self.request_commands, self.command_duration, self.template_duration):
+            lines.extend(histogram.render())
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
@@ -1,24 +1,54 @@
-from dataclasses import dataclass, field
+import datetime
+from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class Budget:
     _id: str
+    user_id: str
     amount: float
     date: str
 
 @dataclass
 class Expense:
     _id: str
+    user_id: str
     title: str
     type: str
     amount: float
     date: str
+    rule_id: Optional[str] = None
 
 @dataclass
 class User:
     _id: str
     email: str
     password: str
-    expenses: list[str] = field(default_factory=list)
-    budgets: list[str] = field(default_factory=list)
 
+@dataclass
+class UserContext:
+    _id: str
+    email: str
+    recurring: bool = False
+
+@dataclass
+class Notification:
+    _id: str
+    user_id: str
+    key: str
+    month: str
+    message: str
+    created: datetime.datetime
+    read: bool
+
+@dataclass
+class RecurringRule:
+    _id: str
+    user_id: str
+    title: str
+    type: str
+    amount: float
+    frequency: str
+    start: str
+    end: Optional[str] = None
+    materialized: Optional[str] = None
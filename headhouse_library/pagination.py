@@ -0,0 +1,39 @@
+import base64
+import json
+
+SORT_FIELDS = ("date", "amount", "title")
+
+
+def encode_cursor(document, sort_field):
+    payload = json.dumps([document[sort_field], document["_id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return value, last_id
+
+
+def keyset_page(collection, query, sort_field, descending=False, cursor=None, limit=50):
+    """Return one page sorted by (sort_field, _id) and the cursor of the next page, if any."""
+    direction = -1 if descending else 1
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        operator = "$lt" if descending else "$gt"
+        query = {
+            **query,
+            "$or": [
+                {sort_field: {operator: value}},
+                {sort_field: value, "_id": {operator: last_id}}
+            ]
+        }
+
+    documents = list(
+        collection.find(query).sort([(sort_field, direction), ("_id", direction)]).limit(limit + 1)
+    )
+    next_cursor = encode_cursor(documents[limit - 1], sort_field) if len(documents) > limit else None
+    return documents[:limit], next_cursor
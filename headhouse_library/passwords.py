@@ -0,0 +1,101 @@
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from flask import current_app
+from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+
+
+class HashingBusy(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def crypt_context(schemes, rounds):
+    settings = {"schemes": list(schemes), "deprecated": "auto"}
+    if rounds:
+        settings[f"{schemes[0]}__rounds"] = rounds
+    return CryptContext(**settings)
+
+
+def hash_password(policy, password):
+    return crypt_context(*policy).hash(password)
+
+
+def verify_password(policy, password, password_hash):
+    return crypt_context(*policy).verify_and_update(password, password_hash)
+
+
+class PasswordHasher:
+    """Runs passlib in a small process pool, admitting a bounded number of hashes server-wide.
+
+    Admission is a multiprocessing semaphore created in init_app, so under gunicorn
+    --preload every forked worker shares it: once PASSWORD_HASH_MAX_PENDING hashes are
+    running or queued across all workers, callers get HashingBusy at once instead of
+    occupying a worker for a full hash. They also get it when a hash takes longer than
+    PASSWORD_HASH_TIMEOUT. The pool itself is created lazily in each process.
+    """
+
+    def __init__(self, app=None):
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        schemes = tuple(
+            scheme.strip() for scheme in app.config.setdefault("PASSWORD_SCHEMES", "pbkdf2_sha256").split(",")
+        )
+        for scheme in schemes:
+            handler = get_crypt_handler(scheme)
+            if hasattr(handler, "get_backend"):
+                handler.get_backend()
+
+        self.policy = (schemes, app.config.setdefault("PASSWORD_ROUNDS", None))
+        self.workers = app.config.setdefault("PASSWORD_HASH_WORKERS", 1)
+        self.timeout = app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10)
+        self._pending = multiprocessing.BoundedSemaphore(
+            app.config.setdefault("PASSWORD_HASH_MAX_PENDING", (os.cpu_count() or 1) * 2)
+        )
+        app.extensions["passwords"] = self
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(self.policy, *args)
+
+        if not self._pending.acquire(False):
+            raise HashingBusy()
+        try:
+            future = self._executor().submit(func, self.policy, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+        # The slot is freed when the pool is done with the job, not when the caller gives up,
+        # so jobs abandoned after a timeout still count against PASSWORD_HASH_MAX_PENDING.
+        future.add_done_callback(lambda _: self._pending.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy()
+
+    def hash(self, password):
+        return self._run(hash_password, password)
+
+    def verify(self, password, password_hash):
+        """Return (valid, new_hash); new_hash is set when the stored hash is below the current policy."""
+        return self._run(verify_password, password, password_hash)
+
+
+def get_hasher():
+    return current_app.extensions["passwords"]
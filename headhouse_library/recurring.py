@@ -0,0 +1,183 @@
+import datetime
+from dataclasses import asdict
+from pymongo import ReturnDocument, UpdateOne
+
+from headhouse_library import ledger, summaries
+from headhouse_library.cache import invalidate_user
+from headhouse_library.forms import FREQUENCIES
+
+OCCURRENCE_FIELDS = ("title", "type", "amount")
+
+
+def month_number(month):
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def month_label(number):
+    return f"{number // 12}-{number % 12 + 1:02d}-01"
+
+
+def current_month():
+    return summaries.month_of(datetime.date.today().isoformat())
+
+
+def occurrences(rule, start, end):
+    """Months between `start` and `end` (inclusive) on which the rule falls due."""
+    step = FREQUENCIES[rule["frequency"]]
+    first = month_number(rule["start"])
+    last = month_number(end)
+    if rule.get("end"):
+        last = min(last, month_number(rule["end"]))
+
+    lower = max(month_number(start), first)
+    due = first + (lower - first + step - 1) // step * step
+    return [month_label(number) for number in range(due, last + 1, step)]
+
+
+def occurrence(rule, month):
+    return {
+        "_id": f"{rule['_id']}:{month}",
+        "user_id": rule["user_id"],
+        **{field: rule[field] for field in OCCURRENCE_FIELDS},
+        "date": month,
+        "rule_id": rule["_id"]
+    }
+
+
+def materialize(db, user_id, rules, through):
+    """Write the occurrences due up to `through`, never past the current month, in one bulk_write.
+
+    Occurrence IDs are derived from the rule and month, so views racing each other insert
+    each one once. Rules remember the month they are written up to, so an occurrence the
+    user deleted is not written again.
+    """
+    through = min(summaries.month_of(through), current_month())
+    due = [rule for rule in rules if (rule.get("materialized") or "") < through and rule["start"] <= through]
+    if not due:
+        return []
+
+    documents = []
+    for rule in due:
+        start = month_label(month_number(rule["materialized"]) + 1) if rule.get("materialized") else rule["start"]
+        documents += [occurrence(rule, month) for month in occurrences(rule, start, through)]
+
+    inserted = []
+    if documents:
+        result = db.expense.bulk_write([
+            UpdateOne(
+                {"_id": document["_id"]},
+                {"$setOnInsert": {field: value for field, value in document.items() if field != "_id"}},
+                upsert=True
+            )
+            for document in documents
+        ], ordered=False)
+        inserted = [documents[index] for index in result.upserted_ids]
+
+    db.recurring_rule.update_many(
+        {
+            "_id": {"$in": [rule["_id"] for rule in due]},
+            "$or": [{"materialized": None}, {"materialized": {"$lt": through}}]
+        },
+        {"$set": {"materialized": through}}
+    )
+    for rule in due:
+        rule["materialized"] = through
+
+    if inserted:
+        months = summaries.record_expenses(db, user_id, inserted)
+        ledger.changed(db, user_id, *months)
+    return inserted
+
+
+def projected(rules, start, end):
+    """month_totals() of the occurrences after the current month; these are counted, never written."""
+    start = month_label(max(month_number(start), month_number(current_month()) + 1))
+    return summaries.month_totals(
+        occurrence(rule, month) for rule in rules for month in occurrences(rule, start, end)
+    )
+
+
+def refresh(db, user, start, end):
+    """Bring a view of the months `start`..`end` up to date; return their projected totals.
+
+    `user` is the cached UserContext, whose `recurring` flag spares users without rules
+    any query; otherwise this costs a single query when nothing is due.
+    """
+    if not user.recurring:
+        return {}
+    rules = list(db.recurring_rule.find({"user_id": user._id}))
+    if not rules:
+        return {}
+    materialize(db, user._id, rules, end)
+    return projected(rules, start, end)
+
+
+def get_rules(db, user_id):
+    return db.recurring_rule.find({"user_id": user_id}).sort("start", 1)
+
+
+def set_recurring_flag(db, user_id):
+    """Keep the user's `recurring` flag, loaded with the user context, in step with their rules."""
+    has_rules = db.recurring_rule.find_one({"user_id": user_id}, {"_id": 1}) is not None
+    db.user.update_one({"_id": user_id}, {"$set": {"recurring": has_rules}})
+    invalidate_user(user_id)
+
+
+def add_rule(db, rule):
+    db.recurring_rule.insert_one(asdict(rule))
+    set_recurring_flag(db, rule.user_id)
+    ledger.changed(db, rule.user_id, current_month())
+
+
+def update_rule(db, user_id, rule_id, fields):
+    """Apply `fields` to a rule and to its occurrences from the current month on.
+
+    Those occurrences are updated in one update_many and the ones no longer due are
+    removed in one delete_many; past months keep what was actually spent.
+    """
+    rule = db.recurring_rule.find_one_and_update(
+        {"_id": rule_id, "user_id": user_id}, {"$set": fields}, return_document=ReturnDocument.AFTER
+    )
+    if rule is None:
+        return None
+
+    start = current_month()
+    future = list(db.expense.find({"user_id": user_id, "rule_id": rule_id, "date": {"$gte": start}}))
+    due = set(occurrences(rule, start, max((expense["date"] for expense in future), default=start)))
+    kept = [expense for expense in future if expense["date"] in due]
+    dropped = [expense for expense in future if expense["date"] not in due]
+
+    values = {field: rule[field] for field in OCCURRENCE_FIELDS}
+    deltas = {}
+    if kept:
+        db.expense.update_many({"_id": {"$in": [expense["_id"] for expense in kept]}}, {"$set": values})
+    if dropped:
+        db.expense.delete_many({"_id": {"$in": [expense["_id"] for expense in dropped]}})
+    for expense in future:
+        summaries.add_delta(deltas, expense, sign=-1)
+    for expense in kept:
+        summaries.add_delta(deltas, {**expense, **values})
+
+    # A new schedule may fall due this month; let the next view write that occurrence.
+    previous = month_label(month_number(start) - 1)
+    db.recurring_rule.update_one({"_id": rule_id, "materialized": {"$gt": previous}}, {"$set": {"materialized": previous}})
+
+    months = summaries.apply_deltas(db, user_id, deltas)
+    ledger.changed(db, user_id, start, *months)
+    return rule
+
+
+def delete_rule(db, user_id, rule_id):
+    """Delete a rule and its occurrences from the current month on."""
+    if db.recurring_rule.delete_one({"_id": rule_id, "user_id": user_id}).deleted_count == 0:
+        return False
+    set_recurring_flag(db, user_id)
+
+    start = current_month()
+    query = {"user_id": user_id, "rule_id": rule_id, "date": {"$gte": start}}
+    future = list(db.expense.find(query, {"type": 1, "amount": 1, "date": 1}))
+    if future:
+        db.expense.delete_many(query)
+    months = summaries.record_expenses(db, user_id, future, sign=-1)
+    ledger.changed(db, user_id, start, *months)
+    return True
@@ -1,4 +1,6 @@
+import io
 import uuid
+import calendar
 import datetime
 import functools
 from flask import (
@@ -9,13 +11,28 @@ from flask import (
     current_app, 
     url_for,
     flash,
-    session
+    session,
+    abort,
+    Response,
+    stream_with_context,
+    g
 )
 from dateutil import relativedelta, parser
 from dataclasses import asdict
-from passlib.hash import pbkdf2_sha256
-from headhouse_library.models import Budget, Expense, User
-from headhouse_library.forms import BudgetForm, ExpenseForm, RegisterForm, LoginForm, DeleteExpenseForm
+from werkzeug.exceptions import TooManyRequests
+from headhouse_library.models import Expense, Notification, RecurringRule, User, UserContext
+from headhouse_library.dashboard import add_projected, get_dashboard
+from headhouse_library.analytics import get_analytics
+from headhouse_library import archive, exporter, importer, ledger, recurring, summaries
+from headhouse_library.alerts import queue_alerts
+from headhouse_library.cache import cached
+from headhouse_library.database import read_db
+from headhouse_library.pagination import SORT_FIELDS, keyset_page
+from headhouse_library.passwords import HashingBusy, get_hasher
+from headhouse_library.forms import (
+    EXPENSE_TYPES, CAP_FIELDS, BudgetForm, ExpenseForm, RegisterForm, LoginForm, DeleteExpenseForm, ImportExpensesForm,
+    CategoryCapsForm, RecurringRuleForm
+)
 
 
 pages = Blueprint(
@@ -31,81 +48,51 @@ def date_range(selected_date: datetime.date):
     ]
     return dates
 
-def get_total_budget(user, start_date, end_date):
-    pipeline = [
-        {
-            "$match": {
-                "date": {
-                    "$gte": start_date.strftime("%Y-%m-%d"),
-                    "$lte": end_date.strftime("%Y-%m-%d")
-                },
-                "_id": {"$in": user.budgets}
-            }
-        },
-        {
-            "$group": {
-                "_id": None,
-                "total_budget": {"$sum": "$amount"}
-            }
-        }
-    ]
-
-    result = current_app.db.budget.aggregate(pipeline)
-    total_budget = next(result, {"total_budget": 0})["total_budget"]
-    return total_budget
-
-def get_total_expenses(user, start_date, end_date):
-    pipeline = [
-        {
-            "$match": {
-                "date": {
-                    "$gte": start_date.strftime("%Y-%m-%d"),
-                    "$lte": end_date.strftime("%Y-%m-%d")
-                },
-                "_id": {"$in": user.expenses}
-            }
-        },
-        {
-            "$group": {
-                "_id": None,
-                "total_expenses": {"$sum": "$amount"}
-            }
-        }
-    ]
-
-    result = current_app.db.expense.aggregate(pipeline)
-    total_expenses = next(result, {"total_expenses": 0})["total_expenses"]
-    return total_expenses
-
-def get_category_expenses(user, start_date, end_date):
-    pipeline = [
-        {
-            "$match": {
-                "date": {
-                    "$gte": start_date.strftime("%Y-%m-%d"),
-                    "$lte": end_date.strftime("%Y-%m-%d")
-                },
-                "_id": {"$in": user.expenses}
-            }
-        },
-        {
-            "$group": {
-                "_id": "$type",
-                "total_amount": {"$sum": "$amount"}
-            }
-        }
-    ]
+def require_month(date):
+    """Abort with 400 unless `date` is a month start (YYYY-MM-01), the key expenses and summaries use."""
+    try:
+        parsed = datetime.date.fromisoformat(date)
+    except ValueError:
+        abort(400)
+    if parsed.day != 1 or parsed.isoformat() != date:
+        abort(400)
+
+def load_month(user_id, date):
+    db = read_db()
+    budget = db.budget.find_one({"user_id": user_id, "date": date}, {"amount": 1})
+
+    return {
+        "budget_amount": budget["amount"] if budget else 0,
+        "summary": summaries.get_summary(db, user_id, date)
+    }
+
+def load_user_context(user_id):
+    user_data = current_app.db.user.find_one({"_id": user_id}, {"_id": 1, "email": 1, "recurring": 1})
+    return UserContext(**user_data) if user_data else None
+
+def current_user_context():
+    user_id = session.get("user_id")
+    if user_id is None:
+        return None
+
+    ttl = current_app.config["USER_CONTEXT_TTL"]
+    if ttl:
+        user = cached(user_id, "session", "user", lambda: load_user_context(user_id), ttl=ttl)
+    else:
+        user = load_user_context(user_id)
 
-    result = current_app.db.expense.aggregate(pipeline)
-    category_expenses = {category["_id"]: category["total_amount"] for category in result}
-    sorted_category_expenses = dict(sorted(category_expenses.items(), key=lambda item: item[1], reverse=True))
-    return sorted_category_expenses
+    if user is None:
+        session.clear()
+    return user
 
 def login_required(route):
     @functools.wraps(route)
     def route_wrapper(*args, **kwargs):
-        if session.get("email") is None:
-            return redirect(url_for(".login"))
+        user = current_user_context()
+        if user is None:
+            return redirect(url_for("pages.login"))
+
+        g.user = user
         return route(*args, **kwargs)
     return route_wrapper
 
@@ -118,10 +105,15 @@ def register():
     form = RegisterForm()
 
     if form.validate_on_submit():
+        try:
+            password_hash = get_hasher().hash(form.password.data)
+        except HashingBusy:
+            raise TooManyRequests(retry_after=1)
+
         user = User(
             _id=uuid.uuid4().hex,
             email=form.email.data,
-            password=pbkdf2_sha256.hash(form.password.data)
+            password=password_hash
         )
 
         current_app.db.user.insert_one(asdict(user))
@@ -140,14 +132,24 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user_data = current_app.db.user.find_one({"email": form.email.data})
+        user_data = current_app.db.user.find_one(
+            {"email": form.email.data}, {"_id": 1, "email": 1, "password": 1}
+        )
         if not user_data:
             flash("Login credentials not correct", category="danger")
             return redirect(url_for(".login"))
 
         user = User(**user_data)
 
-        if user and pbkdf2_sha256.verify(form.password.data, user.password):
+        try:
+            password_valid, new_hash = get_hasher().verify(form.password.data, user.password)
+        except HashingBusy:
+            raise TooManyRequests(retry_after=1)
+
+        if password_valid:
+            if new_hash:
+                current_app.db.user.update_one({"_id": user._id}, {"$set": {"password": new_hash}})
+
             session["user_id"] = user._id
             session["email"] = user.email
 
@@ -174,17 +176,18 @@ def index():
     else:
         selected_date = datetime.date.today()
 
-    start_date = datetime.date(year=selected_date.year, month=1, day=1)
-    end_date = datetime.date(year=selected_date.year, month=12, day=31)
-
-    user_data = current_app.db.user.find_one({"email": session["email"]})
-    user = User(**user_data)
-
-    total_budget = get_total_budget(user,start_date, end_date)
-    total_expenses = get_total_expenses(user, start_date, end_date)
-    category_expenses = get_category_expenses(user, start_date, end_date)
+    user_id = g.user._id
+    projected = recurring.refresh(
+        current_app.db, g.user, f"{selected_date.year}-01-01", f"{selected_date.year}-12-01"
+    )
+    dashboard = cached(
+        user_id, str(selected_date.year), "dashboard",
+        lambda: get_dashboard(read_db(), user_id, selected_date.year)
+    )
+    dashboard = add_projected(dashboard, projected)
 
-    budget_amount = total_budget
+    total_expenses = dashboard["total_expenses"]
+    budget_amount = dashboard["total_budget"]
     budget_left = budget_amount - total_expenses
     savings = round(budget_left, 3)
 
@@ -195,52 +198,77 @@ def index():
         selected_date=selected_date,
         datetime=datetime,
         total_expenses=total_expenses,
-        category_expenses=category_expenses,
+        category_expenses=dashboard["category_expenses"],
+        months=dashboard["months"],
         budget_amount=budget_amount,
         budget_left=budget_left,
         savings=savings
     )
 
+@pages.route("/analytics")
+@login_required
+def analytics():
+    user_id = g.user._id
+    today = datetime.date.today()
+    data = cached(user_id, today.isoformat(), "analytics", lambda: get_analytics(read_db(), user_id, today))
+
+    return render_template(
+        "analytics.html",
+        title="HEADHOUSE | Analytics",
+        analytics=data,
+        month_names=list(calendar.month_abbr)[1:]
+    )
+
 @pages.route("/budget_manager")
 @login_required
 def budget_manager():
-    user_data = current_app.db.user.find_one({"email": session["email"]})
-    user = User(**user_data)
+    user_id = g.user._id
     date = request.args.get("date")
 
     formatted_date = datetime.datetime.strptime(date, "%Y-%m-%d")
     formatted_date = formatted_date.strftime("%B %Y").upper()
 
-    get_expenses = current_app.db.expense.find({"date": date, "_id": {"$in": user.expenses}})
-    expenses = [Expense(**expense) for expense in get_expenses]
-
-    get_budget = current_app.db.budget.find_one({"date": date, "_id": {"$in": user.budgets}})
-    budget_amount = 0
-
-    if get_budget is None:
-        default_budget = Budget(
-            _id=uuid.uuid4().hex,
-            amount=0,
-            date=date
-        )
-        current_app.db.budget.insert_one(asdict(default_budget))
-    else:
-        budget_amount = get_budget["amount"]
-
-    total_expenses = round(sum(expense.amount for expense in expenses), 2)
+    sort = request.args.get("sort", "date")
+    order = request.args.get("order", "asc")
+    category = request.args.get("type")
+    if sort not in SORT_FIELDS or order not in ("asc", "desc") or (category and category not in EXPENSE_TYPES):
+        abort(400)
+
+    query = {"user_id": user_id, "date": date}
+    if category:
+        query["type"] = category
+
+    projected = recurring.refresh(current_app.db, g.user, date, date)
+    month = cached(user_id, summaries.month_of(date), "month", lambda: load_month(user_id, date))
+    budget_amount = month["budget_amount"]
+    summary = month["summary"]
+
+    page_options = dict(
+        descending=order == "desc",
+        cursor=request.args.get("after"),
+        limit=current_app.config["EXPENSES_PER_PAGE"]
+    )
+    try:
+        page, next_cursor = keyset_page(read_db().expense, query, sort, **page_options)
+        # Closed years may have been moved to expense_archive; the summary still counts them.
+        if not page and summary["count"] and date[:4] < str(datetime.date.today().year):
+            page, next_cursor = archive.archived_page(
+                read_db(), user_id, date, category, sort, **page_options
+            ) or (page, next_cursor)
+    except ValueError:
+        abort(400)
+    expenses = [Expense(**expense) for expense in page]
+
+    expense_count = summary["count"]
+    projected_spent = 0
+    if summaries.month_of(date) in projected:
+        projected_spent = round(projected[summaries.month_of(date)]["spent"], 2)
+        summary = summaries.add_totals(summary, projected[summaries.month_of(date)])
+
+    total_expenses = round(summary["spent"], 2)
     budget_left = budget_amount - total_expenses
     budget_left_round = round(budget_left, 2)
 
-    category_expenses = {}
-    for expense in expenses:
-        category = expense.type
-        if category in category_expenses:
-            category_expenses[category] += expense.amount
-        else:
-            category_expenses[category] = expense.amount
-
-    sorted_category_expenses = dict(sorted(category_expenses.items(), key=lambda item: item[1], reverse=True))
-
     return render_template(
         "budget_manager.html", 
         title="HEADHOUSE | BudgetManager",
@@ -250,35 +278,25 @@ def budget_manager():
         all_expenses=total_expenses,
         date=date,
         formatted_date=formatted_date,
-        category_expenses=sorted_category_expenses  
+        category_expenses=summaries.sorted_categories(summary["categories"]),
+        expense_count=expense_count,
+        projected_spent=projected_spent,
+        expense_types=EXPENSE_TYPES,
+        sort=sort,
+        order=order,
+        category=category,
+        next_cursor=next_cursor
     )
 
 
 @pages.route("/budget_manager/set_budget/<date>", methods=["GET", "POST"])
 @login_required
 def set_budget(date):
+    require_month(date)
     form = BudgetForm()
 
     if form.validate_on_submit():
-        budget = Budget(
-            _id=uuid.uuid4().hex,
-            amount=form.amount.data,
-            date=date
-        )
-
-        user_id = session["user_id"]
-        user = current_app.db.user.find_one({"_id": user_id})
-
-        previous_budget = current_app.db.budget.find_one({"_id": {"$in": user["budgets"]}, "date": date})
-        if previous_budget:
-            current_app.db.budget.delete_many({"_id": previous_budget["_id"]})
-            current_app.db.user.update_one({"_id": user_id}, {"$pull": {"budgets": previous_budget["_id"]}})
-
-        current_app.db.budget.insert_one(asdict(budget))
-        current_app.db.user.update_one(
-            {"_id": user_id},
-            {"$push": {"budgets": budget._id}}
-        )
+        ledger.set_budgets(current_app.db, g.user._id, {date: form.amount.data})
         flash("Budget has been saved.", "success")
 
         return redirect(url_for(".budget_manager", date=date))
@@ -293,21 +311,19 @@ def set_budget(date):
 @pages.route("/budget_manager/add_expense/<date>", methods=["GET", "POST"])
 @login_required
 def add_expense(date):
+    require_month(date)
     form = ExpenseForm()
 
     if form.validate_on_submit():
         expense = Expense(
             _id=uuid.uuid4().hex,
+            user_id=g.user._id,
             title=(form.title.data).capitalize(),
             type=form.type.data,
             amount=form.amount.data,
             date=date
         )
-        current_app.db.expense.insert_one(asdict(expense))
-        current_app.db.user.update_one(
-            {"_id": session["user_id"]}, 
-            {"$push": {"expenses": expense._id}}
-        )
+        ledger.add_expenses(current_app.db, expense.user_id, [expense])
 
         return redirect(url_for(".budget_manager", date=date))
 
@@ -321,16 +337,26 @@ def add_expense(date):
 @pages.route("/budget_manager/edit_expense/<date>/<expense_id>", methods=["GET", "POST"])
 @login_required
 def edit_expense(date, expense_id):
-    expense = Expense(**current_app.db.expense.find_one({"_id": expense_id}))
+    require_month(date)
+    expense_data = current_app.db.expense.find_one({"_id": expense_id, "user_id": g.user._id})
+    if expense_data is None:
+        # Shown from the archive; saving reopens the year through ledger.update_expenses().
+        expense_data = archive.find_archived(current_app.db, g.user._id, date, expense_id)
+    if expense_data is None:
+        abort(404)
+
+    expense = Expense(**expense_data)
     form = ExpenseForm(obj=expense)
 
     if form.validate_on_submit():
-        expense.title = form.title.data
-        expense.type = form.type.data
-        expense.amount = form.amount.data
-        expense.date = date
-
-        current_app.db.expense.update_one({"_id": expense_id}, {"$set": asdict(expense)})
+        ledger.update_expenses(current_app.db, expense.user_id, {
+            expense_id: {
+                "title": form.title.data,
+                "type": form.type.data,
+                "amount": form.amount.data,
+                "date": date
+            }
+        }, dates=[date])
         return redirect(url_for(".budget_manager", date=date, expense_id=expense._id))
 
     return render_template(
@@ -345,13 +371,18 @@ def edit_expense(date, expense_id):
 @pages.route("/budget_manager/delete_expense/<date>/<expense_id>", methods=["GET", "POST"])
 @login_required
 def delete_expense(date, expense_id):
-    user_id = session["user_id"]
-    expense = current_app.db.expense.find_one({"_id": expense_id})
+    require_month(date)
+    user_id = g.user._id
+    expense = current_app.db.expense.find_one({"_id": expense_id, "user_id": user_id})
+    if expense is None:
+        expense = archive.find_archived(current_app.db, user_id, date, expense_id)
+    if expense is None:
+        abort(404)
+
     form = DeleteExpenseForm()
 
     if form.validate_on_submit():
-        current_app.db.expense.delete_one({"_id": expense_id})
-        current_app.db.user.update_one({"_id": user_id}, {"$pull": {"expenses": expense_id}})
+        ledger.delete_expenses(current_app.db, user_id, [expense_id], dates=[date])
         flash("Expense deleted successfully.", "success")
         return redirect(url_for(".budget_manager", date=date))
 
@@ -363,4 +394,198 @@ def delete_expense(date, expense_id):
         form=form
     )
 
-    
\ No newline at end of file
+    
+
+
+@pages.route("/budget_manager/import", methods=["GET", "POST"])
+@login_required
+def import_expenses():
+    form = ImportExpensesForm()
+    report = None
+
+    if form.validate_on_submit():
+        user_id = g.user._id
+        lines = io.TextIOWrapper(form.file.data.stream, encoding="utf-8-sig", newline="")
+        report = importer.import_expenses(
+            current_app.db,
+            user_id,
+            lines,
+            columns={
+                "date": form.date_column.data,
+                "title": form.title_column.data,
+                "type": form.type_column.data,
+                "amount": form.amount_column.data
+            },
+            batch_size=current_app.config["IMPORT_BATCH_SIZE"],
+            delimiter=form.delimiter.data,
+            expense_sign=form.expense_sign.data,
+            date_order=form.date_order.data
+        )
+        if report.imported:
+            ledger.changed(current_app.db, user_id, *report.months)
+        flash(
+            f"Imported {report.imported} expenses ({report.rows_per_second:.0f} rows/s).",
+            "success"
+        )
+        if report.failed:
+            flash(f"{report.failed} rows could not be imported.", "danger")
+
+    return render_template(
+        "import_expenses.html",
+        title="HEADHOUSE | BudgetManager - ImportExpenses",
+        form=form,
+        report=report
+    )
+
+
+@pages.route("/inbox", methods=["GET", "POST"])
+@login_required
+def inbox():
+    user_id = g.user._id
+    form = CategoryCapsForm()
+
+    if form.validate_on_submit():
+        caps = {
+            expense_type: form[field_name].data
+            for expense_type, field_name in CAP_FIELDS.items()
+            if form[field_name].data
+        }
+        current_app.db.user.update_one({"_id": user_id}, {"$set": {"category_caps": caps}})
+        queue_alerts(user_id, datetime.date.today().isoformat())
+        flash("Category caps saved.", "success")
+
+        return redirect(url_for(".inbox"))
+
+    if request.method == "GET":
+        user_data = current_app.db.user.find_one({"_id": user_id}, {"category_caps": 1}) or {}
+        for expense_type, field_name in CAP_FIELDS.items():
+            form[field_name].data = user_data.get("category_caps", {}).get(expense_type)
+
+    notifications = [
+        Notification(**notification)
+        for notification in current_app.db.notification.find({"user_id": user_id}).sort("created", -1).limit(50)
+    ]
+    unread = [notification._id for notification in notifications if not notification.read]
+    if unread:
+        current_app.db.notification.update_many({"_id": {"$in": unread}}, {"$set": {"read": True}})
+
+    return render_template(
+        "inbox.html",
+        title="HEADHOUSE | Inbox",
+        notifications=notifications,
+        form=form,
+        cap_fields=CAP_FIELDS
+    )
+
+
+@pages.route("/export")
+@login_required
+def export_expenses():
+    start = request.args.get("start")
+    end = request.args.get("end")
+    types = request.args.getlist("type")
+    export_format = request.args.get("format", "csv")
+
+    try:
+        for date in (start, end):
+            if date:
+                datetime.date.fromisoformat(date)
+    except ValueError:
+        abort(400)
+    if export_format not in exporter.EXPORT_FORMATS or any(t not in EXPENSE_TYPES for t in types):
+        abort(400)
+
+    mimetype, format_lines = exporter.EXPORT_FORMATS[export_format]
+    query = exporter.export_query(g.user._id, start, end, types)
+    cursor = exporter.export_cursor(current_app.db, query, current_app.config["EXPORT_BATCH_SIZE"])
+    cursor = exporter.merge_archived(
+        cursor, archive.archived_expenses(current_app.db, g.user._id, start, end, types)
+    )
+    filename = f"expenses-{start or 'all'}-{end or 'all'}.{export_format}"
+
+    return Response(
+        stream_with_context(exporter.chunked(format_lines(cursor))),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@pages.route("/recurring", methods=["GET", "POST"])
+@login_required
+def recurring_rules():
+    user_id = g.user._id
+    form = RecurringRuleForm()
+
+    if form.validate_on_submit():
+        recurring.add_rule(current_app.db, RecurringRule(
+            _id=uuid.uuid4().hex,
+            user_id=user_id,
+            title=form.title.data.capitalize(),
+            type=form.type.data,
+            amount=form.amount.data,
+            frequency=form.frequency.data,
+            start=form.start.data.isoformat(),
+            end=form.end.data.isoformat() if form.end.data else None
+        ))
+        flash("Recurring expense saved.", "success")
+
+        return redirect(url_for(".recurring_rules"))
+
+    rules = [RecurringRule(**rule) for rule in recurring.get_rules(current_app.db, user_id)]
+
+    return render_template(
+        "recurring.html",
+        title="HEADHOUSE | Recurring",
+        rules=rules,
+        form=form,
+        delete_form=DeleteExpenseForm()
+    )
+
+
+@pages.route("/recurring/<rule_id>/edit", methods=["GET", "POST"])
+@login_required
+def edit_recurring_rule(rule_id):
+    user_id = g.user._id
+    rule_data = current_app.db.recurring_rule.find_one({"_id": rule_id, "user_id": user_id})
+    if rule_data is None:
+        abort(404)
+
+    rule = RecurringRule(**rule_data)
+    form = RecurringRuleForm(data={
+        **asdict(rule),
+        "start": datetime.date.fromisoformat(rule.start),
+        "end": datetime.date.fromisoformat(rule.end) if rule.end else None
+    })
+
+    if form.validate_on_submit():
+        recurring.update_rule(current_app.db, user_id, rule_id, {
+            "title": form.title.data.capitalize(),
+            "type": form.type.data,
+            "amount": form.amount.data,
+            "frequency": form.frequency.data,
+            "start": form.start.data.isoformat(),
+            "end": form.end.data.isoformat() if form.end.data else None
+        })
+        flash("Recurring expense updated from this month on.", "success")
+
+        return redirect(url_for(".recurring_rules"))
+
+    return render_template(
+        "recurring.html",
+        title="HEADHOUSE | Recurring - Edit",
+        rule=rule,
+        form=form
+    )
+
+
+@pages.route("/recurring/<rule_id>/delete", methods=["POST"])
+@login_required
+def delete_recurring_rule(rule_id):
+    form = DeleteExpenseForm()
+
+    if form.validate_on_submit():
+        if not recurring.delete_rule(current_app.db, g.user._id, rule_id):
+            abort(404)
+        flash("Recurring expense deleted; past months are kept.", "success")
+
+    return redirect(url_for(".recurring_rules"))
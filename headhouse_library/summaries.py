@@ -0,0 +1,170 @@
+from pymongo import ReplaceOne, UpdateOne
+
+
+def month_of(date):
+    return f"{date[:7]}-01"
+
+
+def expense_delta(expense, sign=1):
+    return {
+        "spent": sign * expense["amount"],
+        "count": sign,
+        f"categories.{expense['type']}": sign * expense["amount"]
+    }
+
+
+def merge_deltas(*deltas):
+    merged = {}
+    for delta in deltas:
+        for field, value in delta.items():
+            merged[field] = merged.get(field, 0) + value
+    return merged
+
+
+def add_delta(deltas, expense, sign=1):
+    month = month_of(expense["date"])
+    deltas[month] = merge_deltas(deltas.get(month, {}), expense_delta(expense, sign))
+
+
+def apply_deltas(db, user_id, deltas):
+    if deltas:
+        db.monthly_summary.bulk_write([
+            UpdateOne({"user_id": user_id, "month": month}, {"$inc": delta}, upsert=True)
+            for month, delta in deltas.items()
+        ], ordered=False)
+    return list(deltas)
+
+
+def record_expenses(db, user_id, expenses, sign=1):
+    deltas = {}
+    for expense in expenses:
+        add_delta(deltas, expense, sign)
+    return apply_deltas(db, user_id, deltas)
+
+
+def record_budgets(db, user_id, amounts):
+    if amounts:
+        db.monthly_summary.bulk_write([
+            UpdateOne({"user_id": user_id, "month": month_of(date)}, {"$set": {"budget": amount}}, upsert=True)
+            for date, amount in amounts.items()
+        ], ordered=False)
+    return [month_of(date) for date in amounts]
+
+
+def get_summaries(db, user_id, start_month, end_month):
+    return db.monthly_summary.find(
+        {"user_id": user_id, "month": {"$gte": start_month, "$lte": end_month}}
+    )
+
+
+def get_summary(db, user_id, date):
+    summary = db.monthly_summary.find_one({"user_id": user_id, "month": month_of(date)})
+    return {**empty_summary(user_id, month_of(date)), **(summary or {})}
+
+
+def sorted_categories(categories):
+    return {
+        category: round(amount, 2)
+        for category, amount in sorted(categories.items(), key=lambda item: item[1], reverse=True)
+        if round(amount, 2) != 0
+    }
+
+
+def empty_summary(user_id, month):
+    return {"user_id": user_id, "month": month, "spent": 0, "count": 0, "budget": 0, "categories": {}}
+
+
+def month_totals(expenses):
+    """{month: {"spent", "count", "categories"}} of the given expense documents."""
+    months = {}
+    for expense in expenses:
+        month = months.setdefault(month_of(expense["date"]), {"spent": 0, "count": 0, "categories": {}})
+        month["spent"] += expense["amount"]
+        month["count"] += 1
+        month["categories"][expense["type"]] = month["categories"].get(expense["type"], 0) + expense["amount"]
+    return months
+
+
+def add_totals(summary, totals):
+    """Return a copy of `summary` with one month of month_totals() added to it."""
+    categories = dict(summary["categories"])
+    for category, amount in totals["categories"].items():
+        categories[category] = categories.get(category, 0) + amount
+    return {
+        **summary,
+        "spent": summary["spent"] + totals["spent"],
+        "count": summary["count"] + totals["count"],
+        "categories": categories
+    }
+
+
+def compute_summaries(db, user_id):
+    summaries = {}
+
+    expense_totals = db.expense.aggregate([
+        {"$match": {"user_id": user_id}},
+        {
+            "$group": {
+                "_id": {"date": "$date", "type": "$type"},
+                "amount": {"$sum": "$amount"},
+                "count": {"$sum": 1}
+            }
+        }
+    ])
+    for total in expense_totals:
+        month = month_of(total["_id"]["date"])
+        summary = summaries.setdefault(month, empty_summary(user_id, month))
+        summary["spent"] += total["amount"]
+        summary["count"] += total["count"]
+        categories = summary["categories"]
+        categories[total["_id"]["type"]] = categories.get(total["_id"]["type"], 0) + total["amount"]
+
+    archives = db.expense_archive.find({"user_id": user_id}, {"months": 1})
+    for archive in archives:
+        for month, totals in archive["months"].items():
+            summaries[month] = add_totals(summaries.get(month) or empty_summary(user_id, month), totals)
+
+    budgets = db.budget.find({"user_id": user_id}, {"_id": 0, "date": 1, "amount": 1})
+    for budget in budgets:
+        month = month_of(budget["date"])
+        summary = summaries.setdefault(month, empty_summary(user_id, month))
+        summary["budget"] = budget["amount"]
+
+    return summaries
+
+
+def summary_drift(expected, actual, tolerance=0.005):
+    fields = {"spent", "count", "budget"}
+    categories = set(expected.get("categories", {})) | set(actual.get("categories", {}))
+    drift = []
+    for field in sorted(fields):
+        if abs(expected.get(field, 0) - actual.get(field, 0)) > tolerance:
+            drift.append(field)
+    for category in sorted(categories):
+        expected_amount = expected.get("categories", {}).get(category, 0)
+        actual_amount = actual.get("categories", {}).get(category, 0)
+        if abs(expected_amount - actual_amount) > tolerance:
+            drift.append(f"categories.{category}")
+    return drift
+
+
+def rebuild_summaries(db, user_id, write=True):
+    expected = compute_summaries(db, user_id)
+    current = {summary["month"]: summary for summary in db.monthly_summary.find({"user_id": user_id})}
+
+    drifted = {}
+    for month in sorted(set(expected) | set(current)):
+        drift = summary_drift(expected.get(month, {}), current.get(month, {}))
+        if drift:
+            drifted[month] = drift
+
+    if write and drifted:
+        replacements = [
+            ReplaceOne({"user_id": user_id, "month": month}, expected[month], upsert=True)
+            for month in drifted if month in expected
+        ]
+        if replacements:
+            db.monthly_summary.bulk_write(replacements, ordered=False)
+        db.monthly_summary.delete_many({"user_id": user_id, "month": {"$nin": list(expected)}})
+
+    return drifted